@@ -0,0 +1,194 @@
+from audio_silence import chunk_silent_starts, frame_at, lookback_start, merge_silence, \
+    nonsilent_from_silent, segment_length
+from collections import deque
+from concurrent.futures import Executor
+from pcm_stream import SAMPLE_WIDTH, StreamingOnsetEnvelope, decode_to_file, \
+    probe_audio, to_mono_float
+from pydub import AudioSegment
+from typing import Iterable, Iterator, List, Optional, Tuple
+import os
+import tempfile
+
+import numpy as np
+
+
+# Chunk length for parallel analysis; a few chunks per worker balance the load.
+DEFAULT_ANALYSIS_CHUNK_MS = 5 * 60 * 1000
+
+
+class PCMFile:
+    """
+    A file decoded once to raw 16-bit PCM in a temporary file, which worker
+    processes memory-map instead of being sent samples.
+
+    The temporary file takes about 10 MB per minute of 44.1 kHz stereo and is
+    removed on exit.
+
+    Usage::
+
+        with PCMFile(path) as pcm, ProcessPoolExecutor() as executor:
+            ranges = detect_nonsilent_parallel(pcm, executor)
+    """
+
+    def __init__(self, path: str, frame_rate: Optional[int] = None,
+                 channels: Optional[int] = None, temp_dir: Optional[str] = None):
+        """
+        Args:
+            path (str): The audio file.
+            frame_rate (int): Optional. Frame rate of the file; probed if not given.
+            channels (int): Optional. Number of channels; probed if not given.
+            temp_dir (str): Optional. Where to put the PCM file.
+        """
+        if frame_rate is None or channels is None:
+            info = probe_audio(path)
+            frame_rate = frame_rate or info['frame_rate']
+            channels = channels or info['channels']
+        self.source = path
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.temp_dir = temp_dir
+        self.path = None
+        self.frames = 0
+
+    def __enter__(self) -> 'PCMFile':
+        fd, self.path = tempfile.mkstemp(suffix='.s16le', dir=self.temp_dir)
+        os.close(fd)
+        try:
+            self.frames = decode_to_file(self.source, self.path, self.frame_rate,
+                                         self.channels)
+        except BaseException:
+            os.remove(self.path)
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        os.remove(self.path)
+
+    def __len__(self) -> int:
+        # The length pydub would give the audio, in ms.
+        return segment_length(self.frames, self.frame_rate)
+
+
+def open_pcm(pcm_path: str) -> np.ndarray:
+    """
+    Returns the interleaved samples of a PCM file as a read-only memory map.
+
+    Every task maps the file afresh and the map is released with the array, so
+    worker processes that outlive a PCMFile keep no mapping of its removed file.
+    """
+    if not os.path.getsize(pcm_path):
+        return np.zeros(0, dtype=np.int16)
+    return np.memmap(pcm_path, dtype=np.int16, mode='r')
+
+
+def _silence_chunk(pcm_path, frame_rate, channels, start_ms, end_ms, min_silence_len,
+                   silence_thresh, seg_len):
+    samples = open_pcm(pcm_path)
+    first = frame_at(lookback_start(start_ms, min_silence_len), frame_rate)
+    last = frame_at(end_ms, frame_rate)
+    return chunk_silent_starts(samples[first * channels:last * channels], frame_rate,
+                               channels, start_ms, end_ms, min_silence_len,
+                               silence_thresh, seg_len=seg_len)
+
+
+def detect_nonsilent_parallel(pcm: PCMFile, executor: Executor,
+                              chunk_size: int = DEFAULT_ANALYSIS_CHUNK_MS,
+                              min_silence_len: int = 1000,
+                              silence_thresh: float = -16) -> List[List[int]]:
+    """
+    detect_nonsilent on a PCMFile, with its chunks analysed in parallel.
+
+    Every chunk is handed to a worker as a millisecond range; the worker reads
+    it, with its lookback, from the memory-mapped PCM and returns its silent
+    window starts (see audio_silence.chunk_silent_starts), which are merged
+    here. The ranges are identical to detect_nonsilent on the whole file.
+    """
+    seg_len = len(pcm)
+    bounds = list(range(0, seg_len, chunk_size)) + [seg_len]
+    futures = [executor.submit(_silence_chunk, pcm.path, pcm.frame_rate, pcm.channels,
+                               start_ms, end_ms, min_silence_len, silence_thresh,
+                               seg_len if end_ms == seg_len else None)
+               for start_ms, end_ms in zip(bounds[:-1], bounds[1:])]
+    starts = [future.result() for future in futures]
+    if not starts:
+        starts = [np.zeros(0, np.int64)]
+    silent_ranges = merge_silence(np.concatenate(starts), min_silence_len)
+    return nonsilent_from_silent(silent_ranges, seg_len)
+
+
+def _onset_chunk(pcm_path, frame_rate, channels, first_sample, last_sample, total_samples,
+                 hop_length):
+    # Envelope values first_sample // hop_length to last_sample // hop_length - 1
+    # (to the end for the last chunk). A fresh envelope is only exact from a few
+    # frames after where it starts, so it starts that much earlier and runs on
+    # far enough past the end for the values it holds back.
+    samples = open_pcm(pcm_path)
+    onset = StreamingOnsetEnvelope(frame_rate, hop_length=hop_length)
+    # Chunks start on a hop, so near the start of the file the warm-up is cut
+    # short at its first sample, from where the envelope is exact anyway.
+    warmup = min(3 + onset.n_fft // (2 * hop_length), first_sample // hop_length)
+    start = first_sample - warmup * hop_length
+    stop = min(total_samples, last_sample + onset.n_fft + 2 * hop_length)
+    block = samples[start * channels:stop * channels].reshape(-1, channels)
+    parts = [onset.feed(to_mono_float(block))]
+    if stop == total_samples:
+        parts.append(onset.close())
+    envelope = np.concatenate(parts)[warmup:]
+    if last_sample < total_samples:
+        envelope = envelope[:(last_sample - first_sample) // hop_length]
+    return envelope
+
+
+def onset_envelope_parallel(pcm: PCMFile, executor: Executor, hop_length: int = 512,
+                            chunk_size: int = DEFAULT_ANALYSIS_CHUNK_MS) -> np.ndarray:
+    """
+    The onset strength envelope of a PCMFile (see StreamingOnsetEnvelope), with
+    its chunks computed in parallel from the memory-mapped PCM.
+    """
+    step = frame_at(chunk_size, pcm.frame_rate) // hop_length * hop_length
+    step = max(hop_length, step)
+    bounds = list(range(0, pcm.frames, step)) + [pcm.frames]
+    futures = [executor.submit(_onset_chunk, pcm.path, pcm.frame_rate, pcm.channels,
+                               first, last, pcm.frames, hop_length)
+               for first, last in zip(bounds[:-1], bounds[1:])]
+    return np.concatenate([future.result() for future in futures] or
+                          [np.zeros(1, dtype=np.float32)])
+
+
+def _export_segment(pcm_path, frame_rate, channels, start_ms, end_ms, output_file,
+                    format):
+    samples = open_pcm(pcm_path)
+    first = frame_at(start_ms, frame_rate) * channels
+    last = frame_at(end_ms, frame_rate) * channels
+    segment = AudioSegment(data=samples[first:last].tobytes(), sample_width=SAMPLE_WIDTH,
+                           frame_rate=frame_rate, channels=channels)
+    segment.export(output_file, format=format)
+    return output_file
+
+
+def export_segments(pcm: PCMFile, executor: Executor,
+                    segments: Iterable[Tuple[int, int, str]], max_pending: int,
+                    format: str = 'mp3') -> Iterator[str]:
+    """
+    Encodes segments of a PCMFile in parallel.
+
+    At most max_pending segments are queued or being encoded at once, and the
+    output files are yielded in the order of segments, whatever order the
+    workers finish in.
+
+    Args:
+        segments (Iterable[Tuple[int, int, str]]): (start_ms, end_ms, output_file)
+                                                   for every segment.
+        max_pending (int): Maximum number of segments submitted and not yet
+                           yielded.
+        format (str): The export format.
+    """
+    pending = deque()
+    for start_ms, end_ms, output_file in segments:
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+        pending.append(executor.submit(_export_segment, pcm.path, pcm.frame_rate,
+                                       pcm.channels, start_ms, end_ms, output_file,
+                                       format))
+    while pending:
+        yield pending.popleft().result()
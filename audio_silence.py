@@ -0,0 +1,299 @@
+from pydub import silence as pydub_silence
+from pydub.utils import db_to_float
+from typing import List, Optional
+
+import numpy as np
+
+
+# Milliseconds of audio whose squared samples are summed at a time; bounds the
+# int64 temporaries to a few MB.
+ENERGY_BLOCK_MS = 10 * 1000
+
+_SAMPLE_DTYPES = {1: np.int8, 2: np.int16}
+
+
+def frame_at(ms, frame_rate: int):
+    """
+    Index of the first frame of millisecond ms (an int or an array), as AudioSegment
+    slicing computes it.
+    """
+    return ms * frame_rate // 1000
+
+
+def millisecond_energy(samples: np.ndarray, frame_rate: int, channels: int,
+                       start_ms: int, end_ms: int):
+    """
+    Sums the squared samples of every millisecond.
+
+    Args:
+        samples (np.ndarray): Interleaved samples, from the first frame of start_ms on.
+        start_ms (int): The first millisecond.
+        end_ms (int): The millisecond to stop at. Milliseconds past the last frame
+                      only get the frames there are, as pydub pads a slice running
+                      past the end with silence.
+
+    Returns:
+        The int64 energies of milliseconds start_ms to end_ms - 1, and the number
+        of frames they cover.
+    """
+    bounds = frame_at(np.arange(start_ms, end_ms + 1, dtype=np.int64), frame_rate)
+    bounds -= bounds[0]
+    np.minimum(bounds, len(samples) // channels, out=bounds)
+    bounds *= channels
+    squares = samples[:bounds[-1]].astype(np.int64)
+    np.multiply(squares, squares, out=squares)
+    energy = np.zeros(end_ms - start_ms, dtype=np.int64)
+    # reduceat sums from one index to the next, so leave out empty milliseconds
+    # (below 1 kHz, or past the end), which it would give a sample each.
+    nonempty = bounds[1:] > bounds[:-1]
+    if nonempty.any():
+        energy[nonempty] = np.add.reduceat(squares, bounds[:-1][nonempty])
+    return energy, int(bounds[-1]) // channels
+
+
+def window_starts(first: int, last: int, seek_step: int = 1) -> np.ndarray:
+    """
+    The starts of pydub's windows (multiples of seek_step) from first to last.
+    """
+    first = max(0, -(-first // seek_step) * seek_step)
+    if last < first:
+        return np.zeros(0, dtype=np.int64)
+    return np.arange(first, last + 1, seek_step, dtype=np.int64)
+
+
+def silent_windows(ms_energy: np.ndarray, starts: np.ndarray, base: int,
+                   min_silence_len: int, frame_rate: int, channels: int,
+                   thresh: float) -> np.ndarray:
+    """
+    Tests the min_silence_len windows at starts for silence.
+
+    Args:
+        ms_energy (np.ndarray): Millisecond energies, from millisecond base on,
+                                covering every window.
+        thresh (float): The silence threshold as an amplitude.
+
+    Returns:
+        np.ndarray: True for every silent window.
+    """
+    cumulative = np.zeros(len(ms_energy) + 1, dtype=np.int64)
+    np.cumsum(ms_energy, out=cumulative[1:])
+    offsets = starts - base
+    energy = cumulative[offsets + min_silence_len] - cumulative[offsets]
+    frame_count = (frame_at(starts + min_silence_len, frame_rate)
+                   - frame_at(starts, frame_rate))
+    return is_silent(energy, frame_count * channels, thresh)
+
+
+def is_silent(energy: np.ndarray, sample_count: np.ndarray, thresh: float) -> np.ndarray:
+    """
+    Tests windows with the given sums of squared samples for silence the way pydub
+    does: audioop.rms truncates the root mean square to an int, which is then
+    compared with thresh.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rms = np.floor(np.sqrt(energy / sample_count.astype(np.float64)))
+    return np.where(sample_count > 0, rms, 0) <= thresh
+
+
+def merge_silent_starts(starts: np.ndarray, run_start: int, prev: int,
+                        min_silence_len: int, seek_step: int):
+    """
+    Continues pydub's merging of silent window starts into silent ranges.
+
+    Args:
+        starts (np.ndarray): The next silent window starts, ascending.
+        run_start (int): Start of the open range.
+        prev (int): The last silent window start before starts.
+
+    Returns:
+        The ranges closed by starts, and the new run_start and prev.
+    """
+    if not len(starts):
+        return [], run_start, prev
+    previous = np.concatenate(([prev], starts[:-1]))
+    gap = starts - previous
+    # A new range begins where windows are neither consecutive nor overlapping.
+    breaks = np.flatnonzero((gap != seek_step) & (gap > min_silence_len))
+    range_starts = np.concatenate(([run_start], starts[breaks]))
+    range_ends = previous[breaks] + min_silence_len
+    ranges = [[int(s), int(e)] for s, e in zip(range_starts[:-1], range_ends)]
+    return ranges, int(range_starts[-1]), int(starts[-1])
+
+
+def merge_silence(starts: np.ndarray, min_silence_len: int,
+                  seek_step: int = 1) -> List[List[int]]:
+    """
+    Merges all silent window starts into silent ranges, as detect_silence does.
+    """
+    if not len(starts):
+        return []
+    ranges, run_start, prev = merge_silent_starts(starts[1:], int(starts[0]),
+                                                  int(starts[0]), min_silence_len,
+                                                  seek_step)
+    ranges.append([run_start, prev + min_silence_len])
+    return ranges
+
+
+def nonsilent_from_silent(silent_ranges: List[List[int]],
+                          seg_len: int) -> List[List[int]]:
+    """
+    Inverts silent ranges into nonsilent ones, like pydub.silence.detect_nonsilent.
+    """
+    if not silent_ranges:
+        return [[0, seg_len]]
+    if silent_ranges[0][0] == 0 and silent_ranges[0][1] == seg_len:
+        return []
+    prev_end = 0
+    nonsilent_ranges = []
+    for start, end in silent_ranges:
+        nonsilent_ranges.append([prev_end, start])
+        prev_end = end
+    if end != seg_len:
+        nonsilent_ranges.append([prev_end, seg_len])
+    if nonsilent_ranges[0] == [0, 0]:
+        nonsilent_ranges.pop(0)
+    return nonsilent_ranges
+
+
+def segment_length(frames: int, frame_rate: int) -> int:
+    """
+    The length pydub gives frames frames of audio, in ms.
+    """
+    return round(1000 * (float(frames) / frame_rate))
+
+
+def blockwise_energy(samples: np.ndarray, frame_rate: int, channels: int, start_ms: int,
+                     end_ms: int) -> np.ndarray:
+    """
+    millisecond_energy for milliseconds start_ms to end_ms - 1, computed
+    ENERGY_BLOCK_MS at a time so the int64 temporaries stay small.
+    """
+    frames = len(samples) // channels
+    offset = frame_at(start_ms, frame_rate)
+    energy = np.empty(end_ms - start_ms, dtype=np.int64)
+    for block_start in range(start_ms, end_ms, ENERGY_BLOCK_MS):
+        block_end = min(block_start + ENERGY_BLOCK_MS, end_ms)
+        first = min(frame_at(block_start, frame_rate) - offset, frames)
+        last = min(frame_at(block_end, frame_rate) - offset, frames)
+        energy[block_start - start_ms:block_end - start_ms], _ = millisecond_energy(
+            samples[first * channels:last * channels], frame_rate, channels, block_start,
+            block_end)
+    return energy
+
+
+def lookback_start(start_ms: int, min_silence_len: int) -> int:
+    """
+    Where the samples given to chunk_silent_starts for a chunk starting at
+    start_ms have to begin: min_silence_len ms earlier, within the previous chunk.
+    """
+    return max(0, start_ms - min_silence_len)
+
+
+def chunk_silent_starts(samples: np.ndarray, frame_rate: int, channels: int,
+                        start_ms: int, end_ms: int, min_silence_len: int = 1000,
+                        silence_thresh: float = -16, seek_step: int = 1,
+                        seg_len: Optional[int] = None,
+                        max_possible_amplitude: float = 32768.0) -> np.ndarray:
+    """
+    Finds the silent windows of one chunk of a longer audio, independently of
+    the other chunks.
+
+    A chunk owns the windows whose last millisecond falls within it, so every
+    window of the audio is tested by exactly one chunk; the samples include a
+    lookback of min_silence_len ms before the chunk (see lookback_start) for
+    windows that start in the previous one. The starts of all chunks, in order,
+    give the ranges of detect_silence on the whole audio through merge_silence.
+
+    Args:
+        samples (np.ndarray): Interleaved samples from the first frame of
+                              lookback_start(start_ms, min_silence_len) to the
+                              first frame of end_ms, or to the end of the audio.
+        frame_rate (int): Frames per second.
+        channels (int): Number of channels.
+        start_ms (int): Start of the chunk in the audio, in ms.
+        end_ms (int): End of the chunk in the audio, in ms (exclusive).
+        min_silence_len (int): The minimum length of a silence, in ms.
+        silence_thresh (float): The upper bound for how quiet is silent, in dBFS.
+        seek_step (int): Step between windows, in ms.
+        seg_len (int): The length of the whole audio in ms (see segment_length) if
+                       this is its last chunk, in which case end_ms must equal it.
+        max_possible_amplitude (float): Full scale for the sample width.
+
+    Returns:
+        np.ndarray: The starts of the silent windows, in ms from the start of the
+        audio.
+    """
+    samples = np.asarray(samples).reshape(-1)
+    first_ms = lookback_start(start_ms, min_silence_len)
+    starts = window_starts(start_ms - min_silence_len + 1, end_ms - min_silence_len,
+                           seek_step)
+    if seg_len is not None:
+        # pydub always tests the last window, even off the seek_step grid.
+        last_slice_start = seg_len - min_silence_len
+        if last_slice_start >= first_ms and last_slice_start % seek_step:
+            starts = np.append(starts, last_slice_start)
+    if not len(starts):
+        return starts
+    energy = blockwise_energy(samples, frame_rate, channels, first_ms, end_ms)
+    thresh = db_to_float(silence_thresh) * max_possible_amplitude
+    return starts[silent_windows(energy, starts, first_ms, min_silence_len, frame_rate,
+                                 channels, thresh)]
+
+
+def detect_silence_array(samples: np.ndarray, frame_rate: int, channels: int,
+                         min_silence_len: int = 1000, silence_thresh: float = -16,
+                         seek_step: int = 1,
+                         max_possible_amplitude: float = 32768.0) -> List[List[int]]:
+    """
+    pydub.silence.detect_silence on a buffer of interleaved integer samples.
+
+    The squared samples are summed per millisecond, a block at a time, and the RMS
+    of every window is then computed at once from a cumulative sum of those
+    millisecond energies. Windows, the truncated RMS and the merging of windows
+    into ranges follow pydub exactly, so the ranges are identical to pydub's.
+
+    Args:
+        samples (np.ndarray): Interleaved 8- or 16-bit samples, any shape.
+        frame_rate (int): Frames per second.
+        channels (int): Number of channels.
+        min_silence_len (int): The minimum length of a silence, in ms.
+        silence_thresh (float): The upper bound for how quiet is silent, in dBFS.
+        seek_step (int): Step between windows, in ms.
+        max_possible_amplitude (float): Full scale for the sample width.
+
+    Returns:
+        List[List[int]]: The silent ranges, as [start, end] in ms.
+    """
+    samples = np.asarray(samples).reshape(-1)
+    seg_len = segment_length(len(samples) // channels, frame_rate)
+    starts = chunk_silent_starts(samples, frame_rate, channels, 0, seg_len,
+                                 min_silence_len, silence_thresh, seek_step, seg_len,
+                                 max_possible_amplitude)
+    return merge_silence(starts, min_silence_len, seek_step)
+
+
+def detect_silence(audio_segment, min_silence_len: int = 1000,
+                   silence_thresh: float = -16, seek_step: int = 1) -> List[List[int]]:
+    """
+    Drop-in for pydub.silence.detect_silence that returns the same ranges from
+    NumPy arithmetic on the segment's samples instead of slicing it once per
+    seek_step. Segments wider than 16 bits go to pydub.
+    """
+    dtype = _SAMPLE_DTYPES.get(audio_segment.sample_width)
+    if dtype is None:
+        return pydub_silence.detect_silence(audio_segment, min_silence_len,
+                                            silence_thresh, seek_step)
+    samples = np.frombuffer(audio_segment.raw_data, dtype=dtype)
+    return detect_silence_array(samples, audio_segment.frame_rate, audio_segment.channels,
+                                min_silence_len, silence_thresh, seek_step,
+                                audio_segment.max_possible_amplitude)
+
+
+def detect_nonsilent(audio_segment, min_silence_len: int = 1000,
+                     silence_thresh: float = -16, seek_step: int = 1) -> List[List[int]]:
+    """
+    Drop-in for pydub.silence.detect_nonsilent; see detect_silence.
+    """
+    silent_ranges = detect_silence(audio_segment, min_silence_len, silence_thresh,
+                                   seek_step)
+    return nonsilent_from_silent(silent_ranges, len(audio_segment))
@@ -0,0 +1,96 @@
+"""
+Compares the old File.download write loop with ia_file_download's buffered path.
+
+A local HTTP server in a separate process stands in for an archive.org data node,
+so the numbers measure the client's per-byte overhead rather than the network.
+Reports throughput in MB/s and client CPU time as a percentage of wall time.
+
+    python benchmarks/bench_download_write.py --size-mb 512
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Process, Queue
+from types import SimpleNamespace
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ia_file_download import download_file  # noqa: E402
+
+
+def serve(size: int, port_queue: Queue):
+    block = os.urandom(1024 * 1024)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            sent = 0
+            while sent < size:
+                n = min(len(block), size - sent)
+                self.wfile.write(block[:n])
+                sent += n
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def old_write_loop(session, url, path):
+    # The inner loop of File.download before the tuned write path.
+    response = session.get(url, stream=True, timeout=12)
+    response.raise_for_status()
+    with open(path, 'wb') as fileobj:
+        for chunk in response.iter_content(chunk_size=2048):
+            if chunk:
+                fileobj.write(chunk)
+                fileobj.flush()
+
+
+def new_write_path(session, url, path, size, chunk_size):
+    f = SimpleNamespace(name='bench', identifier='bench', url=url, size=size, md5=None,
+                        mtime=0, auth=None)
+    download_file(session, f, path, ignore_existing=True, chunk_size=chunk_size,
+                  preallocate=True)
+
+
+def measure(label, func, size):
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    func()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    print(f"{label:<28} {size / wall / 1e6:8.1f} MB/s {100 * cpu / wall:6.1f}% CPU")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=256)
+    args = parser.parse_args()
+    size = args.size_mb * 1024 * 1024
+
+    port_queue = Queue()
+    server = Process(target=serve, args=(size, port_queue), daemon=True)
+    server.start()
+    url = f"http://127.0.0.1:{port_queue.get()}/file"
+
+    session = requests.Session()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'bench')
+        measure("iter_content(2048) + flush", lambda: old_write_loop(session, url, path),
+                size)
+        for chunk_mb in (1, 4, 8):
+            chunk_size = chunk_mb * 1024 * 1024
+            measure(f"readinto, {chunk_mb} MiB buffer",
+                    lambda: new_write_path(session, url, path, size, chunk_size), size)
+    server.terminate()
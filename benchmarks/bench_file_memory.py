@@ -0,0 +1,80 @@
+"""
+Measures the memory the files of many items take in each representation.
+
+Compares the metadata dicts as parsed from /metadata responses, which
+internetarchive File objects keep alive and add their own attributes to (measured
+with BaseFile, the File machinery without a session), with FileRecords and a
+FileTable, which keep nothing of the dicts. Memory is measured with tracemalloc
+and reported per million files.
+
+    python benchmarks/bench_file_memory.py --files 1000000
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+from internetarchive.files import BaseFile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ia_files import FileTable, iter_file_records  # noqa: E402
+
+FILES_PER_ITEM = 20
+
+
+def synthetic_items(files: int):
+    """
+    Item metadata shaped like a taper's show: mp3 tracks with their derivatives'
+    usual fields, serialized and parsed back so strings are not shared.
+    """
+    items = []
+    for i in range(0, files, FILES_PER_ITEM):
+        identifier = f'gd{70 + i % 26}-{i % 12 + 1:02d}-{i % 28 + 1:02d}.sbd.miller.{i}'
+        item_files = []
+        for t in range(min(FILES_PER_ITEM, files - i)):
+            item_files.append({
+                'name': f'gd{i}d1t{t:02d}.mp3', 'source': 'derivative',
+                'format': 'VBR MP3',
+                'original': f'gd{i}d1t{t:02d}.flac', 'mtime': str(1400000000 + i + t),
+                'size': str(5000000 + 7919 * t), 'md5': os.urandom(16).hex(),
+                'crc32': os.urandom(4).hex(), 'sha1': os.urandom(20).hex(),
+                'length': f'{300 + t}.12', 'height': '0', 'width': '0',
+                'title': f'Track {t}', 'creator': 'Grateful Dead', 'album': f'Show {i}',
+                'track': str(t + 1)})
+        items.append(json.loads(json.dumps(
+            {'metadata': {'identifier': identifier}, 'files': item_files})))
+    return items
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def report(label, nbytes, files):
+    print(f"{label:<28} {nbytes / files * 1e6 / 2 ** 20:8.0f} MiB per 1M files")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=200000)
+    args = parser.parse_args()
+
+    n = args.files
+    print(f"{n} files in {-(-n // FILES_PER_ITEM)} items")
+    items, dicts_bytes = measure(lambda: synthetic_items(n))
+    report("metadata dicts", dicts_bytes, n)
+    _, files_bytes = measure(lambda: [BaseFile(item, f['name'], f) for item in items
+                                      for f in item['files']])
+    report("File (with its dicts)", dicts_bytes + files_bytes, n)
+    _, records_bytes = measure(lambda: [r for item in items
+                                        for r in iter_file_records(item)])
+    report("FileRecord", records_bytes, n)
+    _, table_bytes = measure(lambda: FileTable.from_items(items))
+    report("FileTable", table_bytes, n)
@@ -0,0 +1,84 @@
+"""
+Compares pydub's detect_nonsilent with audio_silence's NumPy implementation.
+
+The track is synthetic: "songs" of noise with a slowly varying level, 3 to 8
+minutes long, separated by 2 to 6 seconds of near silence. pydub slices the audio
+once per millisecond, so on a full show it runs for hours; it is timed on the
+first --pydub-minutes of the track and extrapolated, and its ranges there are
+checked against the NumPy ones.
+
+    python benchmarks/bench_silence.py --minutes 120
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.silence import detect_nonsilent as pydub_detect_nonsilent
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audio_silence import detect_nonsilent  # noqa: E402
+
+
+def synthetic_show(minutes: float, frame_rate: int, channels: int,
+                   seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    frames = int(minutes * 60 * frame_rate)
+    samples = np.empty((frames, channels), dtype=np.int16)
+    pos = 0
+    while pos < frames:
+        song = min(frames - pos, int(rng.uniform(180, 480) * frame_rate))
+        gap = min(frames - pos - song, int(rng.uniform(2, 6) * frame_rate))
+        # Generate a second at a time to keep the float temporaries small.
+        for start in range(pos, pos + song, frame_rate):
+            n = min(frame_rate, pos + song - start)
+            level = 2000 + 1500 * np.sin(start / frame_rate / 7)
+            samples[start:start + n] = rng.normal(0, level, (n, channels))
+        samples[pos + song:pos + song + gap] = rng.normal(0, 20, (gap, channels))
+        pos += song + gap
+    return samples
+
+
+def segment(samples: np.ndarray, frame_rate: int) -> AudioSegment:
+    return AudioSegment(data=samples.tobytes(), sample_width=2, frame_rate=frame_rate,
+                        channels=samples.shape[1])
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--minutes', type=float, default=120)
+    parser.add_argument('--pydub-minutes', type=float, default=1)
+    parser.add_argument('--frame-rate', type=int, default=44100)
+    parser.add_argument('--channels', type=int, default=2)
+    parser.add_argument('--min-silence-len', type=int, default=2000)
+    parser.add_argument('--silence-thresh', type=float, default=-20)
+    args = parser.parse_args()
+    params = (args.min_silence_len, args.silence_thresh)
+
+    samples = synthetic_show(args.minutes, args.frame_rate, args.channels)
+    print(f"{args.minutes:g} min, {args.frame_rate} Hz, {args.channels} channels, "
+          f"min_silence_len={args.min_silence_len}, silence_thresh={args.silence_thresh}")
+
+    prefix = segment(samples[:int(args.pydub_minutes * 60 * args.frame_rate)],
+                     args.frame_rate)
+    expected, pydub_seconds = timed(pydub_detect_nonsilent, prefix, *params)
+    ranges, _ = timed(detect_nonsilent, prefix, *params)
+    assert ranges == expected, "ranges differ from pydub's"
+    pydub_full = pydub_seconds * args.minutes / args.pydub_minutes
+    print(f"pydub    {pydub_seconds:8.2f} s for {args.pydub_minutes:g} min, "
+          f"about {pydub_full:8.0f} s for the track")
+    del prefix
+
+    audio = segment(samples, args.frame_rate)
+    del samples
+    ranges, numpy_seconds = timed(detect_nonsilent, audio, *params)
+    print(f"numpy    {numpy_seconds:8.2f} s for the track, {len(ranges)} nonsilent "
+          f"ranges, about {pydub_full / numpy_seconds:,.0f}x faster")
@@ -0,0 +1,99 @@
+"""
+Compares Catalog.get_tasks with ia_tasks' streamed task listing.
+
+A local HTTP server in a separate process replays a tasks API response: either a
+recorded one (--recording, e.g. saved with
+curl -u ... 'https://archive.org/services/tasks.php?submitter=...&limit=0&summary=0')
+or a synthetic one of --rows task rows. Reports rows per second and the time to
+the first task.
+
+    python benchmarks/bench_tasks_stream.py --rows 200000
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Process, Queue
+import argparse
+import json
+import os
+import sys
+import time
+
+from internetarchive import get_session
+from internetarchive.catalog import Catalog
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ia_tasks import StreamingCatalog  # noqa: E402
+
+
+def synthetic_response(rows: int) -> bytes:
+    lines = []
+    for i in range(rows):
+        lines.append(json.dumps({
+            'identifier': f'gd{70 + i % 26}-{i % 12 + 1:02d}-{i % 28 + 1:02d}.sbd.{i}',
+            'task_id': 1000000000 + i, 'server': f'ia90{i % 100:04d}.us.archive.org',
+            'cmd': 'derive.php' if i % 3 else 'archive.php', 'args': {'comment': 'bench'},
+            'submittime': (f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d} '
+                           f'12:{i % 60:02d}:00.123456'),
+            'submitter': 'uploader@example.org', 'priority': 0, 'finished': 0,
+            'category': 'catalog', 'color': 'done',
+        }))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def serve(body: bytes, port_queue: Queue):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def measure(label, tasks):
+    start = time.perf_counter()
+    first = None
+    n = 0
+    for _ in tasks():
+        if first is None:
+            first = time.perf_counter() - start
+        n += 1
+    wall = time.perf_counter() - start
+    print(f"{label:<34} {n / wall:10.0f} rows/s  first task after {first:7.3f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--recording', help='A saved tasks API response to replay.')
+    args = parser.parse_args()
+
+    if args.recording:
+        with open(args.recording, 'rb') as f:
+            body = f.read()
+    else:
+        body = synthetic_response(args.rows)
+    print(f"{len(body) / 1e6:.1f} MB response")
+
+    port_queue = Queue()
+    server = Process(target=serve, args=(body, port_queue), daemon=True)
+    server.start()
+    url = f"http://127.0.0.1:{port_queue.get()}/services/tasks.php"
+
+    session = get_session(config={'s3': {'access': 'bench', 'secret': 'bench'}})
+    catalog = Catalog(session)
+    streaming_catalog = StreamingCatalog(session)
+    catalog.url = streaming_catalog.url = url
+
+    measure("Catalog.get_tasks", catalog.get_tasks)
+    measure("StreamingCatalog.get_tasks", streaming_catalog.get_tasks)
+    measure("StreamingCatalog.iter_tasks_stream", streaming_catalog.iter_tasks_stream)
+    server.terminate()
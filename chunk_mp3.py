@@ -1,70 +1,125 @@
-from pydub import AudioSegment
-from pydub.silence import detect_nonsilent
+from audio_pool import PCMFile, detect_nonsilent_parallel, export_segments, \
+    onset_envelope_parallel
+from concurrent.futures import ProcessPoolExecutor
+from pcm_stream import DEFAULT_BLOCK_MS, StreamingOnsetEnvelope, \
+    StreamingSilenceDetector, decode_segment, iter_pcm_blocks, probe_audio, to_mono_float
 import librosa
 import numpy as np
 import os
 
 
-def detect_silence_ranges(audio, min_silence_len=1000, silence_thresh=-40):
+def analyze_audio(big_mp3_path, min_silence_len=1000, silence_thresh=-40, hop_size=512,
+                  block_ms=DEFAULT_BLOCK_MS):
     """
-    Detect nonsilent ranges using pydub.
-    """
-    return detect_nonsilent(audio, min_silence_len=min_silence_len, silence_thresh=silence_thresh)
+    Decode a file once and run silence detection and onset analysis on it together.
 
+    Each decoded block is fed to the silence detector as it is and to the onset
+    envelope as mono float32, so the whole file is never held in memory; only the
+    onset envelope (one float per hop_size samples) is kept.
 
-def refine_boundaries_with_librosa(audio_path, ranges, frame_size=2048, hop_size=512):
+    Returns:
+        tuple: The nonsilent ranges in ms, the onset strength envelope of the whole
+               file, and the file's probe info (frame_rate, channels, duration_ms).
     """
-    Refine segment boundaries using spectral analysis.
+    info = probe_audio(big_mp3_path)
+    sr = info['frame_rate']
+    silence = StreamingSilenceDetector(sr, info['channels'], min_silence_len,
+                                       silence_thresh)
+    onset = StreamingOnsetEnvelope(sr, hop_length=hop_size)
+    parts = []
+    for block in iter_pcm_blocks(big_mp3_path, block_ms, sr, info['channels']):
+        silence.feed(block)
+        parts.append(onset.feed(to_mono_float(block)))
+    silence.close()
+    parts.append(onset.close())
+    return silence.nonsilent_ranges, np.concatenate(parts), info
+
+
+def refine_boundaries_with_librosa(onset_env, ranges, sr, hop_size=512, snap_ms=1000):
     """
-    y, sr = librosa.load(audio_path, sr=None)
+    Refine segment boundaries using spectral analysis.
 
-    # Calculate onset strength
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_size)
+    Peaks are picked in the slice of the whole-file onset envelope under each
+    range, and the range's start is moved to its first onset if that comes within
+    snap_ms of the start.
 
-    # Detect structural transitions within ranges
+    Returns:
+        list: (start, end) pairs in ms, one per range.
+    """
     refined_ranges = []
     for start_ms, end_ms in ranges:
-        start_sample = int((start_ms / 1000) * sr)
-        end_sample = int((end_ms / 1000) * sr)
-
-        # Analyze this section of the audio
-        section = y[start_sample:end_sample]
-        section_onset_env = librosa.onset.onset_strength(y=section, sr=sr, hop_length=hop_size)
+        # Analyze this section of the envelope
+        first = librosa.time_to_frames(start_ms / 1000, sr=sr, hop_length=hop_size)
+        last = librosa.time_to_frames(end_ms / 1000, sr=sr, hop_length=hop_size)
+        section_onset_env = onset_env[first:last + 1]
         peaks = librosa.util.peak_pick(section_onset_env, pre_max=3, post_max=3, pre_avg=3, post_avg=3, delta=0.3,
                                        wait=10)
-        time_peaks = librosa.frames_to_time(peaks, sr=sr, hop_length=hop_size)
+        time_peaks = librosa.frames_to_time(first + peaks, sr=sr, hop_length=hop_size)
 
-        # Convert refined peaks to ms
-        refined_peaks = [(start_ms + int(t * 1000)) for t in time_peaks]
-        refined_ranges.extend(refined_peaks)
+        # Snap the start to the first onset in the range
+        refined_peaks = [int(t * 1000) for t in time_peaks
+                         if start_ms <= t * 1000 < end_ms]
+        if refined_peaks and refined_peaks[0] - start_ms <= snap_ms:
+            start_ms = refined_peaks[0]
+        refined_ranges.append((start_ms, end_ms))
 
     return refined_ranges
 
 
-def split_audio_combined(big_mp3_path, output_dir, min_silence_len=1000, silence_thresh=-40):
+def split_audio_combined(big_mp3_path, output_dir, min_silence_len=1000,
+                         silence_thresh=-40, workers=1):
     """
     Combine silence detection and spectral analysis to split MP3 into songs.
+
+    With more than one worker (default 1; os.cpu_count() is a good choice), the
+    file is decoded once to a temporary PCM file that worker processes share,
+    analysed in parallel chunks, and the songs are encoded in parallel; with 1
+    everything is streamed in this process.
     """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    # Load the large MP3 file
-    audio = AudioSegment.from_file(big_mp3_path)
-
-    # Step 1: Detect initial ranges using silence
-    initial_ranges = detect_silence_ranges(audio, min_silence_len, silence_thresh)
-    print(f"Initial nonsilent ranges: {initial_ranges}")
-
-    # Step 2: Refine boundaries using spectral analysis
-    refined_ranges = refine_boundaries_with_librosa(big_mp3_path, initial_ranges)
-    print(f"Refined boundaries: {refined_ranges}")
-
-    # Step 3: Split and save each segment
-    for i, (start, end) in enumerate(refined_ranges):
-        song_segment = audio[start:end]
-        output_file = os.path.join(output_dir, f"Song_{i + 1}.mp3")
-        song_segment.export(output_file, format="mp3")
-        print(f"Saved: {output_file}")
+    if workers == 1:
+        # Step 1: Detect initial ranges using silence, and the onset envelope, in one
+        # decode
+        initial_ranges, onset_env, info = analyze_audio(big_mp3_path, min_silence_len,
+                                                        silence_thresh)
+        print(f"Initial nonsilent ranges: {initial_ranges}")
+
+        # Step 2: Refine boundaries using spectral analysis
+        refined_ranges = refine_boundaries_with_librosa(onset_env, initial_ranges,
+                                                        info['frame_rate'])
+        print(f"Refined boundaries: {refined_ranges}")
+
+        # Step 3: Split and save each segment
+        for i, (start, end) in enumerate(refined_ranges):
+            song_segment = decode_segment(big_mp3_path, start, end, info['frame_rate'],
+                                          info['channels'])
+            output_file = os.path.join(output_dir, f"Song_{i + 1}.mp3")
+            song_segment.export(output_file, format="mp3")
+            print(f"Saved: {output_file}")
+        return
+
+    with PCMFile(big_mp3_path) as pcm, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        # Step 1: Detect initial ranges using silence, and the onset envelope, in parallel
+        initial_ranges = detect_nonsilent_parallel(pcm, executor,
+                                                   min_silence_len=min_silence_len,
+                                                   silence_thresh=silence_thresh)
+        print(f"Initial nonsilent ranges: {initial_ranges}")
+        onset_env = onset_envelope_parallel(pcm, executor)
+
+        # Step 2: Refine boundaries using spectral analysis
+        refined_ranges = refine_boundaries_with_librosa(onset_env, initial_ranges,
+                                                        pcm.frame_rate)
+        print(f"Refined boundaries: {refined_ranges}")
+
+        # Step 3: Split and save each segment, in order
+        segments = ((start, end, os.path.join(output_dir, f"Song_{i + 1}.mp3"))
+                    for i, (start, end) in enumerate(refined_ranges))
+        for output_file in export_segments(pcm, executor, segments,
+                                           max_pending=2 * workers):
+            print(f"Saved: {output_file}")
 
 
 # Example usage
@@ -1,46 +1,97 @@
-from pydub import AudioSegment
-from pydub.silence import detect_nonsilent
-from pydub.utils import make_chunks
+from audio_pool import PCMFile, detect_nonsilent_parallel, export_segments
+from audio_silence import chunk_silent_starts, frame_at, lookback_start, merge_silence, \
+    nonsilent_from_silent, segment_length
+from concurrent.futures import ProcessPoolExecutor
+from pcm_stream import decode_segment, iter_pcm_blocks, probe_audio
+import math
+import numpy as np
 import os
 
 
-def chunk_audio(audio, chunk_size=10 * 60 * 1000):
+def stream_seam_chunks(big_mp3_path, chunk_size, min_silence_len, frame_rate, channels):
     """
-    Splits the audio into smaller chunks to handle large files.
+    Decodes a file chunk by chunk for chunk_silent_starts, carrying the last
+    min_silence_len ms of every chunk into the next one as its lookback.
     Parameters:
-        audio (AudioSegment): The audio to chunk.
-        chunk_size (int): Size of each chunk in milliseconds (default 10 minutes).
-    Returns:
-        list: List of AudioSegment chunks.
+        big_mp3_path (str): Path to the audio file.
+        chunk_size (int): Size of each chunk in milliseconds.
+        min_silence_len (int): Minimum length of silence to detect in milliseconds.
+        frame_rate (int): Frame rate of the file.
+        channels (int): Number of channels of the file.
+    Yields:
+        tuple: (start_ms, end_ms, samples, seg_len) for every chunk, where samples
+               are interleaved and begin with the lookback, and seg_len is the
+               length of the whole file for the last chunk and None before it.
     """
-    return make_chunks(audio, chunk_size)
+    tail = np.zeros(0, dtype=np.int16)
+    start_ms = 0
+    frames = 0
+
+    def chunk(block, last):
+        nonlocal tail, start_ms, frames
+        frames += len(block)
+        samples = np.concatenate((tail, block.reshape(-1)))
+        first_ms = lookback_start(start_ms, min_silence_len)
+        if last:
+            end_ms = seg_len = segment_length(frames, frame_rate)
+        else:
+            # Up to the last millisecond whose frames have all been read.
+            end_ms = ((frames + 1) * 1000 - 1) // frame_rate
+            seg_len = None
+        next_first = frame_at(lookback_start(end_ms, min_silence_len), frame_rate)
+        tail = samples[(next_first - frame_at(first_ms, frame_rate)) * channels:].copy()
+        result = (start_ms, end_ms, samples, seg_len)
+        start_ms = end_ms
+        return result
 
+    # Read one chunk ahead: only the last chunk may test pydub's final window.
+    pending = None
+    for block in iter_pcm_blocks(big_mp3_path, block_ms=chunk_size, frame_rate=frame_rate,
+                                 channels=channels):
+        if pending is not None:
+            yield chunk(pending, last=False)
+        pending = block.copy()
+    if pending is not None:
+        yield chunk(pending, last=True)
 
-def process_chunk(chunk, chunk_start, output_dir, min_silence_len=2000, silence_thresh=-20):
+
+def detect_nonsilent_in_chunks(big_mp3_path, chunk_size=10 * 60 * 1000,
+                               min_silence_len=2000, silence_thresh=-20, info=None):
     """
-    Processes a single chunk for silence detection and splits into smaller audio files.
+    Detects nonsilent ranges chunk by chunk, with the same result as
+    detect_nonsilent on the whole file: silence straddling a chunk seam is found,
+    and a song crossing one is not cut in two.
     Parameters:
-        chunk (AudioSegment): The audio chunk to process.
-        chunk_start (int): The start time of the chunk in the original audio.
-        output_dir (str): Directory to save the smaller audio files.
+        big_mp3_path (str): Path to the audio file.
+        chunk_size (int): Size of each chunk in milliseconds (default 10 minutes).
         min_silence_len (int): Minimum length of silence to detect in milliseconds.
         silence_thresh (int): Silence threshold in dBFS.
+        info (dict): probe_audio's result for the file; probed if not given.
+    Returns:
+        list: [start, end] nonsilent ranges in milliseconds.
     """
-    nonsilent_ranges = detect_nonsilent(chunk, min_silence_len=min_silence_len, silence_thresh=silence_thresh)
-    print(f"Detected {len(nonsilent_ranges)} nonsilent segments in this chunk.")
+    info = info or probe_audio(big_mp3_path)
+    num_chunks = '?'
+    if info['duration_ms']:
+        num_chunks = math.ceil(info['duration_ms'] / chunk_size)
+    starts = []
+    seg_len = 0
+    chunks = stream_seam_chunks(big_mp3_path, chunk_size, min_silence_len,
+                                info['frame_rate'], info['channels'])
+    for i, (start_ms, end_ms, samples, last_len) in enumerate(chunks):
+        print(f"Processing chunk {i + 1}/{num_chunks}, start time: {start_ms}ms")
+        starts.append(chunk_silent_starts(samples, info['frame_rate'], info['channels'],
+                                          start_ms, end_ms, min_silence_len,
+                                          silence_thresh, seg_len=last_len))
+        seg_len = end_ms
+    if not starts:
+        starts = [np.zeros(0, np.int64)]
+    silent_ranges = merge_silence(np.concatenate(starts), min_silence_len)
+    return nonsilent_from_silent(silent_ranges, seg_len)
 
-    for i, (start, end) in enumerate(nonsilent_ranges):
-        segment = chunk[start:end]
-        segment_start = chunk_start + start
-        segment_end = chunk_start + end
 
-        # Save the segment
-        output_file = os.path.join(output_dir, f"segment_{segment_start}_{segment_end}.mp3")
-        segment.export(output_file, format="mp3")
-        print(f"Saved segment: {output_file}")
-
-
-def split_audio_with_chunks(big_mp3_path, output_dir, chunk_size=10 * 60 * 1000, min_silence_len=2000, silence_thresh=-20):
+def split_audio_with_chunks(big_mp3_path, output_dir, chunk_size=10 * 60 * 1000,
+                            min_silence_len=2000, silence_thresh=-20, workers=1):
     """
     Splits a large MP3 file into smaller segments by processing it in chunks.
     Parameters:
@@ -49,20 +100,48 @@ def split_audio_with_chunks(big_mp3_path, output_dir, chunk_size=10 * 60 * 1000,
         chunk_size (int): Size of each chunk in milliseconds (default 10 minutes).
         min_silence_len (int): Minimum length of silence to detect in milliseconds.
         silence_thresh (int): Silence threshold in dBFS.
+        workers (int): Number of processes to analyse chunks and encode segments with
+                       (default 1). With more than one, the file is first
+                       decoded to a temporary PCM file the processes share; with 1 it
+                       is streamed.
     """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    # Load the large MP3 file
-    audio = AudioSegment.from_file(big_mp3_path)
-    chunks = chunk_audio(audio, chunk_size)
+    # Decode the large MP3 file one chunk at a time rather than all at once
+    info = probe_audio(big_mp3_path)
+    num_chunks = '?'
+    if info['duration_ms']:
+        num_chunks = math.ceil(info['duration_ms'] / chunk_size)
+
+    print(f"Audio split into {num_chunks} chunks of approximately "
+          f"{chunk_size / 1000 / 60} minutes each.")
 
-    print(f"Audio split into {len(chunks)} chunks of approximately {chunk_size / 1000 / 60} minutes each.")
+    if workers > 1:
+        with PCMFile(big_mp3_path, info['frame_rate'], info['channels']) as pcm, \
+                ProcessPoolExecutor(max_workers=workers) as executor:
+            nonsilent_ranges = detect_nonsilent_parallel(pcm, executor, chunk_size,
+                                                         min_silence_len, silence_thresh)
+            print(f"Detected {len(nonsilent_ranges)} nonsilent segments.")
+            segments = ((start, end,
+                         os.path.join(output_dir, f"segment_{start}_{end}.mp3"))
+                        for start, end in nonsilent_ranges)
+            for output_file in export_segments(pcm, executor, segments,
+                                               max_pending=2 * workers):
+                print(f"Saved segment: {output_file}")
+        return
 
-    for i, chunk in enumerate(chunks):
-        chunk_start = i * chunk_size
-        print(f"Processing chunk {i + 1}/{len(chunks)}, start time: {chunk_start}ms")
-        process_chunk(chunk, chunk_start, output_dir, min_silence_len, silence_thresh)
+    nonsilent_ranges = detect_nonsilent_in_chunks(big_mp3_path, chunk_size,
+                                                  min_silence_len, silence_thresh, info)
+    print(f"Detected {len(nonsilent_ranges)} nonsilent segments.")
+
+    # Segments may span chunks, so each is decoded on its own
+    for start, end in nonsilent_ranges:
+        segment = decode_segment(big_mp3_path, start, end, info['frame_rate'],
+                                 info['channels'])
+        output_file = os.path.join(output_dir, f"segment_{start}_{end}.mp3")
+        segment.export(output_file, format="mp3")
+        print(f"Saved segment: {output_file}")
 
 '''
 # Example usage
@@ -0,0 +1,356 @@
+from ia_file_download import JOURNAL_INTERVAL, JOURNAL_SUFFIX, PART_SUFFIX, \
+    StreamHasher, _hash_file, _read_journal, _remove, _write_journal
+from ia_scrape import DEFAULT_PAGE_SIZE
+from ia_tasks import DEFAULT_CHUNK_SIZE as TASKS_CHUNK_SIZE, NDJSONDecoder
+from contextlib import asynccontextmanager
+from internetarchive import __version__ as ia_version
+from internetarchive.config import get_config
+from typing import AsyncIterator, Dict, List, Optional
+from urllib.parse import quote, urlsplit
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+
+DEFAULT_MAX_CONNECTIONS = 256
+# Concurrent requests to any one host; archive.org answers metadata and search
+# from a handful of hosts, and downloads redirect to one data node per item.
+DEFAULT_MAX_PER_HOST = 32
+
+# Read size for downloads.
+DEFAULT_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class AsyncArchiveSession:
+    """
+    asyncio counterpart of ArchiveSession for metadata, search, downloads and tasks.
+
+    Built on one httpx.AsyncClient, so a single process can keep thousands of
+    lookups and downloads in flight without a thread each. The client's pool caps
+    the number of open connections, and a semaphore per host caps the number of
+    requests in flight to it (counted on the host a request is sent to, before
+    redirects). Reads the same ia config as internetarchive.get_session for host,
+    cookies and S3 keys.
+
+    Usage::
+
+        async with AsyncArchiveSession() as session:
+            metadata = await session.get_metadata(
+                'gd1977-05-08.sbd.hicks.4982.sbeok.shnf')
+    """
+
+    def __init__(self, config: Optional[dict] = None, config_file: Optional[str] = None,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 max_per_host: int = DEFAULT_MAX_PER_HOST, timeout: float = 12):
+        """
+        Args:
+            config (dict): Optional. A config dict, as for internetarchive.get_session.
+            config_file (str): Optional. Path to an ia config file.
+            max_connections (int): Maximum number of open connections in total.
+            max_per_host (int): Maximum number of requests in flight to one host.
+            timeout (float): Connect and read timeout in seconds for every request.
+        """
+        self.config = get_config(config, config_file)
+        general = self.config.get('general', {})
+        self.host = general.get('host', 'archive.org')
+        if 'archive.org' not in self.host:
+            self.host += '.archive.org'
+        self.protocol = 'https:' if general.get('secure', True) else 'http:'
+        self.access_key = self.config.get('s3', {}).get('access')
+        self.secret_key = self.config.get('s3', {}).get('secret')
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+
+        cookies = httpx.Cookies()
+        for name, value in self.config.get('cookies', {}).items():
+            cookies.set(name, value.split(';')[0], domain='.archive.org')
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+            timeout=timeout, follow_redirects=True, cookies=cookies,
+            headers={'User-Agent': f'internetarchive/{ia_version} (asyncio; httpx)'})
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def __aenter__(self) -> 'AsyncArchiveSession':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    @property
+    def _s3_auth_header(self) -> Dict[str, str]:
+        if not (self.access_key and self.secret_key):
+            return {}
+        return {'Authorization': f'LOW {self.access_key}:{self.secret_key}'}
+
+    @asynccontextmanager
+    async def _host_slot(self, url: str):
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._host_semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        async with semaphore:
+            yield
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        async with self._host_slot(url):
+            response = await self.client.request(method, url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    async def get_metadata(self, identifier: str) -> dict:
+        """
+        Returns the metadata of an item ({} for unknown identifiers), as
+        ArchiveSession.get_metadata does.
+
+        Raises:
+            httpx.HTTPError: If the request fails.
+        """
+        url = f"{self.protocol}//{self.host}/metadata/{identifier}"
+        response = await self._request('GET', url)
+        return response.json()
+
+    async def search_items(self, query: str, fields: Optional[List[str]] = None,
+                           sorts: Optional[List[str]] = None,
+                           count: int = DEFAULT_PAGE_SIZE) -> AsyncIterator[dict]:
+        """
+        Yields the results of a search, following the scrape API's cursors. The next
+        page is requested while the current one is being consumed.
+
+        Args:
+            query (str): The search query.
+            fields (List[str]): Optional. Metadata fields to return for every item.
+                                'identifier' is always included.
+            sorts (List[str]): Optional. Sort order, e.g. ['date asc'].
+            count (int): Number of items per page (100 to 10000).
+        """
+        url = f"{self.protocol}//{self.host}/services/search/v1/scrape"
+        fields = ['identifier'] + [f for f in (fields or []) if f != 'identifier']
+        params = {'q': query, 'fields': ','.join(fields), 'count': count}
+        if sorts:
+            params['sorts'] = ','.join(sorts)
+
+        async def fetch(page_params):
+            response = await self._request('POST', url, params=page_params, timeout=300)
+            j = response.json()
+            if j.get('error'):
+                raise ValueError(f"scrape request failed for query '{query}': "
+                                 f"{j['error']}")
+            return j
+
+        page = asyncio.ensure_future(fetch(dict(params)))
+        try:
+            while page is not None:
+                j = await page
+                page = None
+                if 'cursor' in j:
+                    page = asyncio.ensure_future(fetch(dict(params, cursor=j['cursor'])))
+                for item in j.get('items', []):
+                    yield item
+        finally:
+            if page is not None:
+                page.cancel()
+
+    async def download(self, identifier: str, name: str, path: str,
+                       file_metadata: Optional[dict] = None, checksum: bool = False,
+                       chunk_size: int = DEFAULT_DOWNLOAD_CHUNK_SIZE) -> int:
+        """
+        Streams a file of an item to path, like File.download, holding at most one
+        chunk of it in memory.
+
+        The file is written to path + '.part' and moved into place when complete.
+        Progress is journaled in path + '.part.json' like
+        ia_file_download.download_file does, and an interrupted download, by
+        either, is resumed with a Range request from the bytes the journal
+        counts. Writes, and hashing for checksum, happen in a worker thread so
+        they never stall the event loop. Sends the session's S3 keys, as
+        File.download does.
+
+        Args:
+            identifier (str): The item identifier.
+            name (str): The file name within the item.
+            path (str): Where to save the file.
+            file_metadata (dict): Optional. The file's entry in the item's metadata
+                                  ('size', 'md5', 'mtime'), used to check the
+                                  download and set its modification time.
+            checksum (bool): If True and file_metadata has an md5, compare it with
+                             the md5 of the downloaded file, computed as it is
+                             written.
+            chunk_size (int): Number of bytes to read and write at a time.
+
+        Returns:
+            int: The number of bytes downloaded.
+
+        Raises:
+            httpx.HTTPError: If the request fails.
+            ValueError: If the size or md5 does not match file_metadata.
+        """
+        file_metadata = file_metadata or {}
+        url = (f"{self.protocol}//{self.host}/download/{identifier}/"
+               f"{quote(name.encode('utf-8'))}")
+        part_path = path + PART_SUFFIX
+        journal_path = path + JOURNAL_SUFFIX
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        # Normalised as File does, so journals are shared with download_file.
+        expected = {'size': int(file_metadata.get('size') or 0),
+                    'md5': file_metadata.get('md5') or None,
+                    'mtime': float(file_metadata.get('mtime') or 0)}
+        journal = _read_journal(journal_path)
+        if journal.get('expected') != expected or not os.path.exists(part_path):
+            journal = {}
+        # download_file grows the part file to full size before segmented or
+        # preallocated downloads, so only the bytes a stream journaled count.
+        offset = 0
+        if 'bytes_received' in journal:
+            offset = min(journal['bytes_received'], os.path.getsize(part_path))
+        journal = {'url': url, 'expected': expected, 'bytes_received': offset}
+
+        hasher = StreamHasher() if checksum and expected['md5'] else None
+
+        def write(f, chunk):
+            f.write(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+
+        received = 0
+        timeout = httpx.Timeout(self.timeout, read=60)
+        async with self._host_slot(url):
+            while True:
+                headers = dict(self._s3_auth_header)
+                if offset:
+                    headers['Range'] = f'bytes={offset}-'
+                if hasher is not None and hasher.bytes_hashed != offset:
+                    # Hash what is kept of the part file before appending to it.
+                    if hasher.bytes_hashed > offset:
+                        hasher.reset()
+                    await asyncio.to_thread(_hash_file, part_path, hasher, offset)
+                async with self.client.stream('GET', url, headers=headers,
+                                              timeout=timeout) as response:
+                    if offset and response.status_code == 416:
+                        # Nothing past offset: complete if the server's size agrees,
+                        # otherwise the part file is longer than the file.
+                        content_range = response.headers.get('Content-Range', '')
+                        total = content_range.rpartition('/')[2]
+                        if total.isdigit() and int(total) == offset:
+                            break
+                        offset = 0
+                        continue
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        offset = 0
+                    mode = 'r+b' if offset else 'wb'
+                    f = await asyncio.to_thread(open, part_path, mode, buffering=0)
+                    try:
+                        await asyncio.to_thread(f.seek, offset)
+                        await asyncio.to_thread(f.truncate)
+                        journaled = offset
+                        async for chunk in response.aiter_bytes(chunk_size):
+                            await asyncio.to_thread(write, f, chunk)
+                            received += len(chunk)
+                            offset += len(chunk)
+                            if offset - journaled >= JOURNAL_INTERVAL:
+                                journal['bytes_received'] = journaled = offset
+                                await asyncio.to_thread(_write_journal, journal_path,
+                                                        journal)
+                    finally:
+                        await asyncio.to_thread(f.close)
+                        journal['bytes_received'] = offset
+                        await asyncio.to_thread(_write_journal, journal_path, journal)
+                break
+
+        size = os.path.getsize(part_path)
+        if expected['size'] and size != expected['size']:
+            _remove(part_path)
+            _remove(journal_path)
+            raise ValueError(f"{identifier}/{name}: expected {expected['size']} bytes, "
+                             f"received {size}")
+        if hasher is not None:
+            # Only reads anything if a 416 found the part file already complete.
+            await asyncio.to_thread(_hash_file, part_path, hasher)
+            if hasher.hexdigests()['md5'] != expected['md5']:
+                _remove(part_path)
+                _remove(journal_path)
+                raise ValueError(f"{identifier}/{name}: md5 mismatch")
+        os.replace(part_path, path)
+        _remove(journal_path)
+        if expected['mtime']:
+            os.utime(path, (time.time(), expected['mtime']))
+        return received
+
+    async def get_tasks(self, identifier: str = '', params: Optional[dict] = None,
+                        chunk_size: int = TASKS_CHUNK_SIZE) -> AsyncIterator[dict]:
+        """
+        Yields the rows of the Tasks API as they arrive, like
+        ia_tasks.StreamingCatalog.iter_tasks_stream but as dicts. Requires S3 keys
+        in the config.
+
+        Args:
+            identifier (str): Optional. Only return tasks for this item.
+            params (dict): Optional. Query parameters for the Tasks API.
+            chunk_size (int): Number of bytes to read from the response at a time.
+        """
+        params = dict(params or {})
+        if identifier:
+            params['identifier'] = identifier
+        params['limit'] = 0
+        if not params.get('summary'):
+            params['summary'] = 0
+        url = f"{self.protocol}//{self.host}/services/tasks.php"
+
+        decoder = NDJSONDecoder()
+        async with self._host_slot(url):
+            async with self.client.stream('GET', url, params=params,
+                                          headers=self._s3_auth_header) as response:
+                if response.is_error:
+                    await response.aread()
+                    raise httpx.HTTPStatusError(
+                        response.json().get('error', response.text),
+                        request=response.request, response=response)
+                async for chunk in response.aiter_bytes(chunk_size):
+                    for row in decoder.feed(chunk):
+                        yield row
+        for row in decoder.close():
+            yield row
+
+
+async def get_metadata_many(session: AsyncArchiveSession,
+                            identifiers: List[str]) -> Dict[str, object]:
+    """
+    Fetches the metadata of many items at once; the session's limits decide how
+    many requests are actually in flight.
+
+    Returns:
+        Dict[str, object]: The metadata of every identifier, or the exception
+        raised while fetching it.
+    """
+    results = await asyncio.gather(*(session.get_metadata(i) for i in identifiers),
+                                   return_exceptions=True)
+    return dict(zip(identifiers, results))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fetch the metadata of every item matching a search, concurrently.")
+    parser.add_argument('query', nargs='?',
+                        default='collection:GratefulDead AND year:1977')
+    parser.add_argument('--max-per-host', type=int, default=DEFAULT_MAX_PER_HOST)
+    args = parser.parse_args()
+
+    async def main():
+        async with AsyncArchiveSession(max_per_host=args.max_per_host) as session:
+            start = time.perf_counter()
+            identifiers = [item['identifier']
+                           async for item in session.search_items(args.query)]
+            results = await get_metadata_many(session, identifiers)
+            failed = sum(isinstance(r, Exception) for r in results.values())
+            print(f"{len(results)} items, {failed} failed, "
+                  f"{time.perf_counter() - start:.1f} s")
+
+    asyncio.run(main())
@@ -0,0 +1,147 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+import argparse
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache',
+                                  'ia_checksums.sqlite')
+
+# Read size for files that cannot be memory-mapped.
+READ_SIZE = 8 * 1024 * 1024
+
+
+class ChecksumCache:
+    """
+    Persistent md5 memo keyed on (path, size, mtime_ns, inode).
+
+    An entry is only returned while the file still has the size, modification time
+    and inode it had when it was hashed, so edited or replaced files are re-hashed.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS checksums ('
+                         'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, '
+                         'inode INTEGER, md5 TEXT)')
+        self._db.commit()
+
+    def get(self, path: str, st: os.stat_result) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT md5 FROM checksums '
+                'WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?',
+                (os.path.abspath(path), st.st_size, st.st_mtime_ns, st.st_ino)).fetchone()
+            if row:
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, path: str, st: os.stat_result, md5: str):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?)',
+                             (os.path.abspath(path), st.st_size, st.st_mtime_ns,
+                              st.st_ino, md5))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self) -> 'ChecksumCache':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _hash_path(path: str) -> str:
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        try:
+            # One C-level update over the mapped file; hashlib releases the GIL for it.
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                md5.update(m)
+        except (ValueError, OSError):
+            # Empty files and some special files cannot be mapped.
+            for block in iter(lambda: f.read(READ_SIZE), b''):
+                md5.update(block)
+    return md5.hexdigest()
+
+
+def get_md5(path: str, cache: Optional[ChecksumCache] = None) -> str:
+    """
+    Returns the md5 of a local file, from cache when it has not changed since.
+
+    Args:
+        path (str): The file to hash.
+        cache (ChecksumCache): Optional. Where to look up and record the result.
+
+    Returns:
+        str: The hex md5 digest.
+    """
+    if cache is None:
+        return _hash_path(path)
+    st = os.stat(path)
+    md5 = cache.get(path, st)
+    if md5 is None:
+        md5 = _hash_path(path)
+        cache.put(path, st, md5)
+    return md5
+
+
+def hash_files(paths: Iterable[str], workers: int = 4,
+               cache: Optional[ChecksumCache] = None) -> Dict[str, str]:
+    """
+    Hashes many files concurrently.
+
+    Args:
+        paths (Iterable[str]): The files to hash.
+        workers (int): Number of files to hash at the same time.
+        cache (ChecksumCache): Optional. Where to look up and record results.
+
+    Returns:
+        Dict[str, str]: The md5 of every file, keyed by path, in input order.
+    """
+    paths = list(paths)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(paths, executor.map(lambda p: get_md5(p, cache), paths)))
+
+
+def iter_directory_files(directory: str) -> Iterable[str]:
+    """
+    Yields the paths of all files below directory, in a stable order.
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            yield os.path.join(root, name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Hash a directory tree, caching results for later ia uploads and "
+                    "downloads.")
+    parser.add_argument('directory')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH)
+    args = parser.parse_args()
+
+    with ChecksumCache(args.cache) as checksum_cache:
+        for file_path, file_md5 in hash_files(iter_directory_files(args.directory),
+                                              args.workers, checksum_cache).items():
+            print(f"{file_md5}  {file_path}")
+    print(f"{checksum_cache.hits} cached, {checksum_cache.misses} hashed")
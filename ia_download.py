@@ -1,10 +1,121 @@
-import internetarchive as ia
+from ia_checksum import ChecksumCache
+from ia_file_download import download_file
+from ia_files import file_index
+from ia_session import get_pooled_session, print_pool_stats
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Optional, List
+import argparse
 import os
+import threading
 
 
-def download_show(id, target_folder: Optional[str] = None):
+# Upper bound on the combined size of files being downloaded at the same time.
+DEFAULT_MAX_INFLIGHT_BYTES = 512 * 1024 * 1024
+
+
+class ByteBudget:
+    """
+    Limits the number of bytes in flight across download worker threads.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes: int) -> int:
+        """
+        Blocks until nbytes fit in the budget and reserves them.
+
+        A file larger than the whole budget is reserved as the full budget, so it
+        still downloads, just on its own.
+
+        Returns:
+            int: The number of bytes reserved, to be passed back to release.
+        """
+        nbytes = min(nbytes, self.limit)
+        with self._cond:
+            while self.in_flight and self.in_flight + nbytes > self.limit:
+                self._cond.wait()
+            self.in_flight += nbytes
+        return nbytes
+
+    def release(self, nbytes: int):
+        with self._cond:
+            self.in_flight -= nbytes
+            self._cond.notify_all()
+
+
+def download_files(item, files, destdir, workers: int = 1,
+                   max_inflight_bytes: int = DEFAULT_MAX_INFLIGHT_BYTES,
+                   ignore_errors: bool = False, segments: int = 1,
+                   checksum: bool = False) -> List[str]:
+    """
+    Downloads files of an item, several at a time, over the item's session.
+
+    Files are saved to destdir/<identifier>/<name>, the same layout Item.download
+    uses, and interrupted downloads are resumed (see download_file). Progress is
+    reported per file in the order the files were given.
+
+    Args:
+        item (Item): The item the files belong to.
+        files (List[File]): The files to download.
+        destdir (str): The directory to download into.
+        workers (int): Number of files to download concurrently.
+        max_inflight_bytes (int): Upper bound on the combined size of the files
+                                  being downloaded at once.
+        ignore_errors (bool): If True, failed files are collected and returned
+                              instead of raising the first error.
+        segments (int): Number of byte ranges to fetch concurrently for large files.
+        checksum (bool): If True, skip existing files based on md5 rather than on
+                         length and date. Checksums are cached on disk, so files
+                         that have not changed since are not read again.
+
+    Returns:
+        List[str]: The names of the files that failed to download.
+    """
+    budget = ByteBudget(max_inflight_bytes)
+    checksum_cache = ChecksumCache() if checksum else None
+    paths = [os.path.join(destdir, item.identifier, f.name) for f in files]
+    # Create directories up front rather than racing on makedirs in the workers.
+    for parent_dir in set(os.path.dirname(path) for path in paths):
+        os.makedirs(parent_dir, exist_ok=True)
+
+    def fetch(f, path):
+        reserved = budget.acquire(int(f.size or 0))
+        try:
+            return download_file(item.session, f, path, ignore_errors=ignore_errors,
+                                 segments=segments, checksum=checksum,
+                                 checksum_cache=checksum_cache)
+        finally:
+            budget.release(reserved)
+
+    errors = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(fetch, f, path) for f, path in zip(files, paths)]
+            for i, (f, future) in enumerate(zip(files, futures), 1):
+                try:
+                    result = future.result()
+                except Exception:
+                    for pending in futures:
+                        pending.cancel()
+                    raise
+                if result is False:
+                    errors.append(f.name)
+                    print(f"[{i}/{len(files)}] {f.name}: failed")
+                else:
+                    print(f"[{i}/{len(files)}] {f.name}: done")
+    finally:
+        if checksum_cache is not None:
+            checksum_cache.close()
+    return errors
+
+
+def download_show(id, target_folder: Optional[str] = None, session=None, workers: int = 1,
+                  ignore_errors: bool = False, segments: int = 1,
+                  checksum: bool = False) -> List[str]:
     """
     Downloads an item from the Internet Archive using the identifier.
 
@@ -12,6 +123,15 @@ def download_show(id, target_folder: Optional[str] = None):
         id (str): The identifier of the Internet Archive item to download.
         target_folder (str): The folder where the downloaded files should be saved.
                                           Defaults to '~/Music/Grateful Dead'.
+        session (ArchiveSession): Optional. A session to reuse across shows.
+                                  Defaults to a new keep-alive pooled session.
+        workers (int): Number of files to download concurrently.
+        ignore_errors (bool): If True, keep going when a file fails to download.
+        segments (int): Number of byte ranges to fetch concurrently for large files.
+        checksum (bool): If True, skip existing files based on md5.
+
+    Returns:
+        List[str]: The names of the files that failed to download.
     """
     # Set default target directory to 'Music/Grateful Dead' under user's home directory
     home_directory = Path.home()  # Gets the user's home directory, e.g., '/Users/username'
@@ -25,16 +145,41 @@ def download_show(id, target_folder: Optional[str] = None):
 
     print(f"Downloading item with identifier '{id}' to {target_dir}...")
 
-    s = ia.get_session()
-    s.mount_http_adapter()
+    if session is None:
+        # Every worker and segment needs its own kept-alive connection to the data node.
+        s = get_pooled_session(pool_maxsize=max(workers * segments, 10))
+    else:
+        s = session
     s_item = s.get_item(id)
     #s_item.metadata
 
-    fnames = [f.name for f in s_item.get_files(id, glob_pattern='*mp3')]
-    for f in fnames:
-        s_item.download(f, destdir=target_dir)
+    files = list(file_index(s_item).get_files(glob_pattern='*mp3'))
+    errors = download_files(s_item, files, target_dir, workers=workers,
+                            ignore_errors=ignore_errors, segments=segments,
+                            checksum=checksum)
+
+    print_pool_stats(s)
+    return errors
 
 
 if __name__ == "__main__":
-    id = 'gd70-02-11.early-late.sbd.sacks.90.sbefail.shnf'
-    download_show(id)
+    parser = argparse.ArgumentParser(
+        description="Download a show from the Internet Archive.")
+    parser.add_argument('identifier', nargs='?',
+                        default='gd70-02-11.early-late.sbd.sacks.90.sbefail.shnf')
+    parser.add_argument('--target-folder', help="Folder under ~/Music to download into.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of files to download concurrently.")
+    parser.add_argument('--segments', type=int, default=1,
+                        help="Number of byte ranges to fetch concurrently for large "
+                             "files.")
+    parser.add_argument('--checksum', action='store_true',
+                        help="Skip existing files based on md5 rather than length and "
+                             "date.")
+    parser.add_argument('--ignore-errors', action='store_true',
+                        help="Keep going when a file fails to download.")
+    args = parser.parse_args()
+
+    download_show(args.identifier, args.target_folder, workers=args.workers,
+                  ignore_errors=args.ignore_errors, segments=args.segments,
+                  checksum=args.checksum)
@@ -0,0 +1,402 @@
+from concurrent.futures import ThreadPoolExecutor
+from ia_checksum import ChecksumCache, get_md5
+from requests.exceptions import ConnectionError, ChunkedEncodingError, ReadTimeout, \
+    RequestException
+from typing import List, Optional, Tuple
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+
+PART_SUFFIX = '.part'
+JOURNAL_SUFFIX = '.part.json'
+
+# How many bytes to receive between journal updates.
+JOURNAL_INTERVAL = 8 * 1024 * 1024
+
+# Files smaller than this are always fetched as a single stream.
+DEFAULT_SEGMENT_THRESHOLD = 64 * 1024 * 1024
+
+# Size of the buffer the response body is read into; 1-8 MiB works well.
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Errors after which the partial file is kept and the download resumed. Reading
+# the raw urllib3 stream raises urllib3's own errors rather than requests' ones.
+RESUMABLE_ERRORS = (ConnectionError, ChunkedEncodingError, ReadTimeout,
+                    ProtocolError, ReadTimeoutError)
+
+
+def _read_journal(journal_path: str) -> dict:
+    try:
+        with open(journal_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_journal(journal_path: str, journal: dict):
+    # Write to a temporary file first so a crash never leaves a torn journal behind.
+    tmp_path = journal_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(journal, f)
+    os.replace(tmp_path, journal_path)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class StreamHasher:
+    """
+    Computes the checksums files.xml lists for a file (md5, sha1, crc32) on bytes
+    as they are written, so a download never has to be read back to be verified.
+    """
+
+    def __init__(self, algorithms: Tuple[str, ...] = ('md5',)):
+        self.algorithms = algorithms
+        self.reset()
+
+    def reset(self):
+        self.bytes_hashed = 0
+        self._hashes = {name: hashlib.new(name) for name in self.algorithms
+                        if name != 'crc32'}
+        self._crc32 = 0 if 'crc32' in self.algorithms else None
+
+    def update(self, data):
+        for h in self._hashes.values():
+            h.update(data)
+        if self._crc32 is not None:
+            self._crc32 = zlib.crc32(data, self._crc32)
+        self.bytes_hashed += len(data)
+
+    def hexdigests(self) -> dict:
+        digests = {name: h.hexdigest() for name, h in self._hashes.items()}
+        if self._crc32 is not None:
+            digests['crc32'] = f"{self._crc32:08x}"
+        return digests
+
+    def mismatches(self, f) -> List[str]:
+        """
+        Returns the names of the checksums that differ from the ones in files.xml.
+        Checksums files.xml does not list for the file are not compared.
+        """
+        return [name for name, digest in self.hexdigests().items()
+                if getattr(f, name, None) and getattr(f, name).lower() != digest]
+
+
+def _hash_file(path: str, hasher: StreamHasher, end: Optional[int] = None):
+    """
+    Feeds the bytes of path from hasher.bytes_hashed up to end into hasher.
+    """
+    with open(path, 'rb') as f:
+        f.seek(hasher.bytes_hashed)
+        remaining = (end if end is not None else os.fstat(f.fileno()).st_size) \
+            - hasher.bytes_hashed
+        while remaining > 0:
+            block = f.read(min(remaining, 1024 * 1024))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+
+
+def _preallocate(fd: int, offset: int, length: int):
+    if length > 0 and hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, offset, length)
+        except OSError:
+            # Not supported by every filesystem.
+            pass
+
+
+def _iter_into(response, buffer: memoryview):
+    """
+    Reads the response body into buffer, yielding a view on each filled part.
+
+    Every view is only valid until the next one is produced.
+    """
+    raw = response.raw
+    raw.decode_content = True
+    while True:
+        n = raw.readinto(buffer)
+        if not n:
+            return
+        yield buffer[:n]
+
+
+def is_downloaded(f, file_path: str) -> bool:
+    """
+    Checks whether file_path already holds the file, based on length and date.
+    """
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return False
+    return st.st_size == f.size and int(st.st_mtime) == int(f.mtime)
+
+
+def download_file(session, f, file_path: str, retries: int = 5, retries_sleep: int = 2,
+                  timeout: Optional[int] = 12, ignore_existing: bool = False,
+                  ignore_errors: bool = False, segments: int = 1,
+                  segment_threshold: int = DEFAULT_SEGMENT_THRESHOLD,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE, preallocate: bool = False,
+                  checksum: bool = False, hashes: Tuple[str, ...] = ('md5',),
+                  checksum_retries: int = 1,
+                  checksum_cache: Optional[ChecksumCache] = None) -> bool:
+    """
+    Downloads a file of an item, resuming from where a previous attempt stopped.
+
+    Data is written to '<file_path>.part', next to a '<file_path>.part.json' journal
+    recording the bytes received so far and the size, md5 and mtime the file is
+    expected to have. When the connection drops, or on the next run, the download
+    continues from the journaled offset with an HTTP Range request. Once the file
+    is complete and its size and checksums match files.xml, it is renamed into place.
+
+    Checksums are computed on the bytes as they are written; a download that does not
+    match is discarded and fetched again up to checksum_retries times.
+
+    Files of at least segment_threshold bytes can be split into byte ranges that are
+    fetched concurrently, each over its own connection, and written in place into a
+    preallocated file. Those arrive out of order, so they are hashed once complete.
+
+    The body is read straight from the urllib3 stream into one reusable buffer of
+    chunk_size bytes per connection, and written without flushing in between.
+
+    Args:
+        session (ArchiveSession): The session to download with.
+        f (File): The file to download.
+        file_path (str): Where to save the file.
+        retries (int): Number of times to resume after a dropped connection.
+        retries_sleep (int): Seconds to wait before the first retry, doubled after
+                             every further one.
+        timeout (int): Connect and read timeout in seconds.
+        ignore_existing (bool): If True, download the file even if it already exists.
+        checksum (bool): If True, skip existing files based on md5 rather than on
+                         length and date.
+        ignore_errors (bool): If True, return False instead of raising on failure.
+        segments (int): Number of byte ranges to fetch concurrently for large files.
+        segment_threshold (int): Minimum size in bytes for a file to be segmented.
+        chunk_size (int): Size in bytes of the read buffer.
+        preallocate (bool): If True, reserve the file's full size on disk before
+                            streaming into it. Segmented downloads always do.
+        hashes (Tuple[str, ...]): The checksums to verify, any of 'md5', 'sha1' and
+                                  'crc32'.
+        checksum_retries (int): Number of times to download the file again after a
+                                size or checksum mismatch.
+        checksum_cache (ChecksumCache): Optional. Used to look up the md5 of existing
+                                        files, and to record the md5 of downloaded
+                                        ones so later checks need not re-read them.
+
+    Returns:
+        bool: True if the file was downloaded or already present, False if it failed
+        and ignore_errors is set.
+    """
+    if not ignore_existing and os.path.exists(file_path):
+        if checksum:
+            if get_md5(file_path, checksum_cache) == f.md5:
+                print(f"Skipping {file_path}, file already exists based on checksum.")
+                return True
+        elif is_downloaded(f, file_path):
+            print(f"Skipping {file_path}, file already exists based on length and date.")
+            return True
+
+    part_path = file_path + PART_SUFFIX
+    journal_path = file_path + JOURNAL_SUFFIX
+    expected = {'size': f.size, 'md5': f.md5, 'mtime': f.mtime}
+    segmented = segments > 1 and f.size >= segment_threshold
+
+    for attempt in range(checksum_retries + 1):
+        journal = _read_journal(journal_path)
+        if journal.get('expected') != expected or not os.path.exists(part_path):
+            # No journal, or the file changed on the server since: start over.
+            journal = {}
+        journal.update({'url': f.url, 'expected': expected})
+
+        hasher = StreamHasher(hashes)
+        try:
+            if segmented:
+                received = _download_segments(session, f, part_path, journal_path,
+                                              journal, segments, retries, retries_sleep,
+                                              timeout, chunk_size)
+            else:
+                received = _download_stream(session, f, part_path, journal_path, journal,
+                                            retries, retries_sleep, timeout, chunk_size,
+                                            preallocate, hasher)
+        except (RequestException, OSError) + RESUMABLE_ERRORS as exc:
+            return _fail(f, file_path, exc, ignore_errors)
+
+        if f.size and received != f.size:
+            exc = IOError(f"size mismatch, expected {f.size} bytes, got {received}")
+        else:
+            if segmented:
+                _hash_file(part_path, hasher)
+            mismatched = hasher.mismatches(f)
+            exc = IOError(f"{', '.join(mismatched)} mismatch") if mismatched else None
+        if exc is None:
+            break
+        # Not resumable: whatever is on disk does not add up to the file.
+        _remove(part_path)
+        _remove(journal_path)
+        if attempt < checksum_retries:
+            print(f"Discarding {f.name}: {exc}, downloading it again...")
+    else:
+        return _fail(f, file_path, exc, ignore_errors)
+
+    os.replace(part_path, file_path)
+    _remove(journal_path)
+    # Set mtime with mtime from files.xml, so the next run can skip the file.
+    if f.mtime:
+        os.utime(file_path, (time.time(), f.mtime))
+    if checksum_cache is not None and 'md5' in hashes:
+        checksum_cache.put(file_path, os.stat(file_path), hasher.hexdigests()['md5'])
+    return True
+
+
+def _download_stream(session, f, part_path: str, journal_path: str, journal: dict,
+                     retries: int, retries_sleep: int, timeout: Optional[int],
+                     chunk_size: int, preallocate: bool, hasher: StreamHasher) -> int:
+    """
+    Fetches the file as a single stream, appending to the partial file and feeding
+    every byte of it to hasher.
+
+    Returns:
+        int: The number of bytes received.
+    """
+    if 'bytes_received' in journal:
+        # Only trust bytes that were both written and journaled.
+        offset = min(journal['bytes_received'], os.path.getsize(part_path))
+    else:
+        offset = 0
+    journal.pop('segments', None)
+    journal['bytes_received'] = offset
+    buffer = memoryview(bytearray(chunk_size))
+
+    attempt = 0
+    while True:
+        try:
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            with session.get(f.url, headers=headers, stream=True, timeout=timeout,
+                             auth=f.auth) as response:
+                if offset and response.status_code == 416:
+                    if offset == f.size:
+                        # Nothing left to fetch, the previous run got every byte.
+                        _hash_file(part_path, hasher, end=offset)
+                        return offset
+                    # The partial file is longer than the file on the server.
+                    offset = 0
+                    continue
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    # The server ignored the Range header and sent the whole file.
+                    offset = 0
+
+                # Unbuffered: the chunks are large enough to go straight to write(2).
+                with open(part_path, 'r+b' if offset else 'wb', buffering=0) as fileobj:
+                    fileobj.seek(offset)
+                    fileobj.truncate()
+                    if preallocate:
+                        _preallocate(fileobj.fileno(), offset, f.size - offset)
+                    # Catch the hasher up with the bytes kept from earlier attempts.
+                    if hasher.bytes_hashed > offset:
+                        hasher.reset()
+                    _hash_file(part_path, hasher, end=offset)
+                    journaled = offset
+                    for chunk in _iter_into(response, buffer):
+                        fileobj.write(chunk)
+                        hasher.update(chunk)
+                        offset += len(chunk)
+                        if offset - journaled >= JOURNAL_INTERVAL:
+                            journal['bytes_received'] = journaled = offset
+                            _write_journal(journal_path, journal)
+            journal['bytes_received'] = offset
+            _write_journal(journal_path, journal)
+            return offset
+        except RESUMABLE_ERRORS:
+            # Every byte counted in offset has been handed to write(2).
+            journal['bytes_received'] = offset
+            _write_journal(journal_path, journal)
+            attempt += 1
+            if attempt > retries:
+                raise
+            print(f"Connection lost downloading {f.name} at byte {offset}, "
+                  f"resuming (attempt {attempt}/{retries})...")
+            time.sleep(retries_sleep * 2 ** (attempt - 1))
+
+
+def _download_segments(session, f, part_path: str, journal_path: str, journal: dict,
+                       segments: int, retries: int, retries_sleep: int,
+                       timeout: Optional[int], chunk_size: int) -> int:
+    """
+    Fetches the file as concurrent byte ranges written at their offsets.
+
+    The journal keeps a [next_byte, last_byte] pair per range, so an interrupted
+    download only fetches what each range is still missing.
+
+    Returns:
+        int: The number of bytes received.
+    """
+    if 'segments' not in journal:
+        segment_size = -(-f.size // segments)
+        journal['segments'] = [[start, min(start + segment_size, f.size) - 1]
+                               for start in range(0, f.size, segment_size)]
+        _remove(part_path)
+    journal.pop('bytes_received', None)
+    journal_lock = threading.Lock()
+
+    fd = os.open(part_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        # Sized up front either way, so every range can be written at its offset.
+        os.ftruncate(fd, f.size)
+        _preallocate(fd, 0, f.size)
+
+        def fetch(segment):
+            buffer = memoryview(bytearray(chunk_size))
+            attempt = 0
+            journaled = segment[0]
+            while segment[0] <= segment[1]:
+                try:
+                    headers = {'Range': f'bytes={segment[0]}-{segment[1]}'}
+                    with session.get(f.url, headers=headers, stream=True,
+                                     timeout=timeout, auth=f.auth) as response:
+                        response.raise_for_status()
+                        if response.status_code != 206:
+                            raise IOError(f"{f.url} does not support range requests")
+                        for chunk in _iter_into(response, buffer):
+                            os.pwrite(fd, chunk, segment[0])
+                            segment[0] += len(chunk)
+                            if segment[0] - journaled >= JOURNAL_INTERVAL:
+                                journaled = segment[0]
+                                with journal_lock:
+                                    _write_journal(journal_path, journal)
+                except RESUMABLE_ERRORS:
+                    attempt += 1
+                    if attempt > retries:
+                        raise
+                    time.sleep(retries_sleep * 2 ** (attempt - 1))
+
+        with ThreadPoolExecutor(max_workers=segments) as executor:
+            futures = [executor.submit(fetch, segment) for segment in journal['segments']]
+            try:
+                for future in futures:
+                    future.result()
+            finally:
+                with journal_lock:
+                    _write_journal(journal_path, journal)
+    finally:
+        os.close(fd)
+    missing = sum(end - start + 1 for start, end in journal['segments'] if start <= end)
+    return f.size - missing
+
+
+def _fail(f, file_path: str, exc: Exception, ignore_errors: bool) -> bool:
+    print(f"Error downloading {f.identifier}/{f.name} to {file_path}: {exc}")
+    if ignore_errors:
+        return False
+    raise exc
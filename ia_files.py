@@ -0,0 +1,373 @@
+from array import array
+from fnmatch import translate
+from internetarchive.files import File
+from typing import Dict, Iterable, Iterator, List, Optional, Pattern, Union
+import json
+import re
+
+
+def compile_globs(patterns: Union[str, List[str], None]) -> Optional[Pattern]:
+    """
+    Compiles glob patterns into a single regex matching any of them.
+
+    Args:
+        patterns (Union[str, List[str]]): A list of patterns, or a string of patterns
+                                          separated by '|' as Item.get_files takes them.
+
+    Returns:
+        Optional[Pattern]: The compiled regex, or None if there are no patterns.
+    """
+    if not patterns:
+        return None
+    if isinstance(patterns, str):
+        patterns = patterns.split('|')
+    return re.compile('|'.join(f'(?:{translate(p)})' for p in patterns))
+
+
+class FileIndex:
+    """
+    Name index over the files of an item.
+
+    Item.get_files deep-copies the whole file list on every call, and every File it
+    yields for a filtered selection looks up its own metadata by scanning that list
+    again, which is quadratic for items with thousands of files. The index is built
+    once from the item's metadata and passes each file's metadata on to File.
+    """
+
+    def __init__(self, item):
+        self.item = item
+        self.item_metadata = item.item_metadata
+        self._files: Dict[str, dict] = {}
+        for f in item.item_metadata.get('files', []):
+            if f.get('name'):
+                self._files[f['name'].strip('/')] = f
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def __contains__(self, name: str) -> bool:
+        return name.strip('/') in self._files
+
+    def get_metadata(self, name: str) -> Optional[dict]:
+        return self._files.get(name.strip('/'))
+
+    def get_file(self, name: str) -> File:
+        """
+        Returns the named file, like Item.get_file but without scanning the file list.
+        """
+        return File(self.item, name, self.get_metadata(name) or {})
+
+    def get_files(self, files=None, formats: Union[str, List[str], None] = None,
+                  glob_pattern: Union[str, List[str], None] = None,
+                  exclude_pattern: Union[str, List[str], None] = None,
+                  on_the_fly: bool = False) -> Iterator[File]:
+        """
+        Selects files the way Item.get_files does, in the order of the item's file list.
+
+        A file is selected if its name is in files, its format is in formats, or its
+        name matches glob_pattern and not exclude_pattern. Unlike Item.get_files, a
+        file matching several of these is yielded only once. With no selection at
+        all, every file is yielded.
+
+        Args:
+            files: Optional. File names (or File objects) to select.
+            formats (Union[str, List[str]]): Optional. Formats to select, e.g. 'VBR MP3'.
+            glob_pattern (Union[str, List[str]]): Optional. Patterns, or '|'-separated
+                                                  patterns, of names to select.
+            exclude_pattern (Union[str, List[str]]): Optional. Patterns of names to
+                                                     leave out of the glob selection.
+            on_the_fly (bool): If True, also consider the item's on-the-fly files
+                               (EPUB, MOBI, DAISY, MARCXML).
+        """
+        if files is not None and not isinstance(files, (list, tuple, set)):
+            files = [files]
+        names = {getattr(f, 'name', f) for f in files or []}
+        if formats is not None and not isinstance(formats, (list, tuple, set)):
+            formats = [formats]
+        formats = set(formats or [])
+        glob = compile_globs(glob_pattern)
+        exclude = compile_globs(exclude_pattern)
+        select_all = not (names or formats or glob)
+
+        candidates = list(self._files.items())
+        if on_the_fly:
+            identifier = self.item.identifier
+            for fmt, name in [('EPUB', f'{identifier}.epub'),
+                              ('MOBI', f'{identifier}.mobi'),
+                              ('DAISY', f'{identifier}_daisy.zip'),
+                              ('MARCXML', f'{identifier}_archive_marc.xml')]:
+                candidates.append((name, {'name': name, 'format': fmt, 'otf': True}))
+
+        for name, metadata in candidates:
+            if (select_all or name in names or metadata.get('format') in formats
+                    or (glob and glob.match(name)
+                        and not (exclude and exclude.match(name)))):
+                yield File(self.item, name, metadata)
+
+
+def file_index(item) -> FileIndex:
+    """
+    Returns the FileIndex of an item, building it on first use and again after the
+    item's metadata has been reloaded.
+    """
+    index = getattr(item, '_file_index', None)
+    if index is None or index.item_metadata is not item.item_metadata:
+        index = FileIndex(item)
+        item._file_index = index
+    return index
+
+
+# Checksums stored as raw bytes rather than hex strings, with their length in bytes.
+_DIGESTS = {'md5': 16, 'sha1': 20, 'crc32': 4}
+
+# Fields FileRecord and FileTable store in typed form; everything else is an extra.
+_TYPED_FIELDS = ('name', 'size', 'mtime') + tuple(_DIGESTS)
+
+
+def _split_metadata(file_metadata: dict):
+    """
+    Returns the size, mtime, digests (raw bytes or None, in _DIGESTS order) and
+    remaining fields of a file's metadata.
+    """
+    size = int(file_metadata.get('size') or 0)
+    mtime = float(file_metadata.get('mtime') or 0)
+    extras = {k: v for k, v in file_metadata.items() if k not in _TYPED_FIELDS}
+    digests = []
+    for field, nbytes in _DIGESTS.items():
+        value = file_metadata.get(field)
+        digest = None
+        if value:
+            try:
+                digest = bytes.fromhex(value)
+            except (TypeError, ValueError):
+                pass
+            if digest is None or len(digest) != nbytes:
+                # Not a digest of the expected length; keep it as it was given.
+                extras[field] = value
+                digest = None
+        digests.append(digest)
+    return size, mtime, digests, extras
+
+
+def _encode_extras(extras: dict) -> bytes:
+    return json.dumps(extras, separators=(',', ':')).encode('utf-8') if extras else b''
+
+
+class FileRecord:
+    """
+    Compact, read-only record of one file of an item.
+
+    Holds name, size and mtime in typed slots, md5, sha1 and crc32 as raw bytes,
+    and all other files.xml fields as one JSON blob that is decoded only when one
+    of them is read. A File instead keeps every field as a separate attribute and
+    also references the metadata dict it was built from.
+    """
+
+    __slots__ = ('identifier', 'name', 'size', 'mtime', '_md5', '_sha1', '_crc32',
+                 '_extras')
+
+    def __init__(self, identifier: str, name: str, size: int = 0, mtime: float = 0.0,
+                 md5: Optional[bytes] = None, sha1: Optional[bytes] = None,
+                 crc32: Optional[bytes] = None, extras: bytes = b''):
+        self.identifier = identifier
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self._md5 = md5
+        self._sha1 = sha1
+        self._crc32 = crc32
+        self._extras = extras
+
+    @classmethod
+    def from_metadata(cls, identifier: str, file_metadata: dict) -> 'FileRecord':
+        """
+        Builds a record from one entry of an item's metadata['files'].
+        """
+        size, mtime, digests, extras = _split_metadata(file_metadata)
+        return cls(identifier, file_metadata['name'].strip('/'), size, mtime, *digests,
+                   extras=_encode_extras(extras))
+
+    def _digest(self, field: str) -> Optional[str]:
+        digest = getattr(self, '_' + field)
+        return digest.hex() if digest is not None else self.extras.get(field)
+
+    @property
+    def md5(self) -> Optional[str]:
+        return self._digest('md5')
+
+    @property
+    def sha1(self) -> Optional[str]:
+        return self._digest('sha1')
+
+    @property
+    def crc32(self) -> Optional[str]:
+        return self._digest('crc32')
+
+    @property
+    def extras(self) -> dict:
+        """
+        The fields other than name, size, mtime and the checksums, e.g. format, source.
+        """
+        return json.loads(self._extras) if self._extras else {}
+
+    @property
+    def metadata(self) -> dict:
+        """
+        The file's metadata as a dict, like File.metadata (size and mtime as numbers).
+        """
+        metadata = {'name': self.name, 'size': self.size, 'mtime': self.mtime}
+        for field in _DIGESTS:
+            digest = getattr(self, '_' + field)
+            if digest is not None:
+                metadata[field] = digest.hex()
+        metadata.update(self.extras)
+        return metadata
+
+    def __getattr__(self, key):
+        # Only called for names that are not slots or properties: look in the extras.
+        if key.startswith('_'):
+            raise AttributeError(key)
+        try:
+            return self.extras[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+    def to_file(self, item) -> File:
+        """
+        Returns a full File for this record, e.g. to download it.
+        """
+        return File(item, self.name, self.metadata)
+
+    def __repr__(self):
+        return (f"FileRecord(identifier={self.identifier!r}, name={self.name!r}, "
+                f"size={self.size}, md5={self.md5!r})")
+
+
+def iter_file_records(item_metadata: dict) -> Iterator[FileRecord]:
+    """
+    Yields a FileRecord for every file in an item's metadata (an Item's
+    item_metadata, or the JSON of /metadata/<identifier>).
+    """
+    identifier = item_metadata.get('metadata', {}).get('identifier')
+    for f in item_metadata.get('files', []):
+        if f.get('name'):
+            yield FileRecord.from_metadata(identifier, f)
+
+
+class FileTable:
+    """
+    Columnar table of the files of one or many items.
+
+    Every field is a column. Sizes, mtimes and identifier numbers are typed
+    arrays; checksums are raw bytes in one bytearray per field; names are UTF-8 in
+    one bytearray with an array of offsets. Other fields are dictionary-encoded,
+    one array of codes per field, so values repeated across files (format, source,
+    creator) are stored once. Rows are read back as FileRecords.
+    """
+
+    def __init__(self):
+        self.identifiers: List[str] = []
+        self._identifier_numbers: Dict[str, int] = {}
+        self._identifier = array('I')
+        self._size = array('q')
+        self._mtime = array('d')
+        self._digests = {field: bytearray() for field in _DIGESTS}
+        self._has_digest = {field: bytearray() for field in _DIGESTS}
+        self._names = bytearray()
+        self._name_offsets = array('Q', [0])
+        # Per extra field: a code per row (0 if the row lacks the field), the
+        # distinct values as JSON text (code - 1 indexes them), and their codes.
+        self._extra_codes: Dict[str, array] = {}
+        self._extra_values: Dict[str, List[str]] = {}
+        self._extra_lookup: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def from_items(cls, items: Iterable) -> 'FileTable':
+        """
+        Builds a table of the files of items, which may be Items or metadata dicts.
+        """
+        table = cls()
+        for item in items:
+            table.add_item(getattr(item, 'item_metadata', item))
+        return table
+
+    def add_item(self, item_metadata: dict):
+        """
+        Appends the files of an item, given its metadata dict.
+        """
+        identifier = item_metadata.get('metadata', {}).get('identifier')
+        for f in item_metadata.get('files', []):
+            if f.get('name'):
+                self.append(identifier, f)
+
+    def append(self, identifier: str, file_metadata: dict):
+        number = self._identifier_numbers.get(identifier)
+        if number is None:
+            number = self._identifier_numbers[identifier] = len(self.identifiers)
+            self.identifiers.append(identifier)
+        size, mtime, digests, extras = _split_metadata(file_metadata)
+        row = len(self._size)
+        self._identifier.append(number)
+        self._size.append(size)
+        self._mtime.append(mtime)
+        for field, digest in zip(_DIGESTS, digests):
+            self._digests[field] += (digest if digest is not None
+                                     else bytes(_DIGESTS[field]))
+            self._has_digest[field].append(digest is not None)
+        self._names += file_metadata['name'].strip('/').encode('utf-8')
+        self._name_offsets.append(len(self._names))
+
+        for key in extras:
+            if key not in self._extra_codes:
+                self._extra_codes[key] = array('I', bytes(4 * row))
+                self._extra_values[key] = []
+                self._extra_lookup[key] = {}
+        for key, codes in self._extra_codes.items():
+            if key not in extras:
+                codes.append(0)
+                continue
+            value = json.dumps(extras[key], separators=(',', ':'))
+            lookup = self._extra_lookup[key]
+            code = lookup.get(value)
+            if code is None:
+                self._extra_values[key].append(value)
+                code = lookup[value] = len(self._extra_values[key])
+            codes.append(code)
+
+    def __len__(self) -> int:
+        return len(self._size)
+
+    def __getitem__(self, i: int) -> FileRecord:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('FileTable index out of range')
+        digests = []
+        for field, nbytes in _DIGESTS.items():
+            if self._has_digest[field][i]:
+                digests.append(bytes(self._digests[field][nbytes * i:nbytes * (i + 1)]))
+            else:
+                digests.append(None)
+        # The values are JSON text already, so the extras blob is joined, not dumped.
+        extras = ','.join(f'{json.dumps(key)}:{self._extra_values[key][codes[i] - 1]}'
+                          for key, codes in self._extra_codes.items() if codes[i])
+        return FileRecord(
+            self.identifiers[self._identifier[i]],
+            self._names[self._name_offsets[i]:self._name_offsets[i + 1]].decode('utf-8'),
+            self._size[i], self._mtime[i], *digests,
+            extras=('{' + extras + '}').encode('utf-8') if extras else b'')
+
+    def __iter__(self) -> Iterator[FileRecord]:
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def sizes(self) -> array:
+        """
+        The size column, e.g. for sum(table.sizes).
+        """
+        return self._size
+
+    @property
+    def mtimes(self) -> array:
+        return self._mtime
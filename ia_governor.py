@@ -0,0 +1,192 @@
+from contextlib import contextmanager
+from typing import Dict, Optional
+import random
+import threading
+import time
+
+
+# How long a check_limit answer is reused before asking again.
+DEFAULT_CHECK_INTERVAL = 5.0
+
+# Backoff after the n-th overload in a row is about BASE_DELAY * 2 ** n seconds,
+# at most MAX_DELAY.
+DEFAULT_BASE_DELAY = 2.0
+DEFAULT_MAX_DELAY = 120.0
+
+DEFAULT_MAX_PUTS_PER_BUCKET = 4
+
+# Serializes get_governor, so that threads sharing a session share one governor.
+_governor_lock = threading.Lock()
+
+
+class _Bucket:
+    def __init__(self, max_puts: int):
+        self.lock = threading.Lock()
+        self.puts = threading.BoundedSemaphore(max_puts)
+        self.checked_at = None
+        self.overloaded = False
+        self.consecutive_overloads = 0
+        self.blocked_until = 0.0
+
+
+class S3Governor:
+    """
+    Client-side rate governor for IA-S3 uploads, shared by all uploads on a session.
+
+    Item.upload_file asks check_limit before every attempt and sleeps a fixed
+    retries_sleep when S3 is overloaded. The governor instead:
+
+    - reuses a bucket's check_limit answer for check_interval seconds,
+    - backs off exponentially, with jitter, after every 503 or over_limit answer,
+      and lets every upload to the bucket wait out the backoff, not only the one
+      that saw it; a successful PUT resets the backoff,
+    - caps the number of concurrent PUTs per bucket,
+    - counts checks, overloads and the seconds uploads spent throttled.
+
+    Thread-safe. Use get_governor to get the one attached to a session.
+    """
+
+    def __init__(self, session, check_interval: float = DEFAULT_CHECK_INTERVAL,
+                 base_delay: float = DEFAULT_BASE_DELAY,
+                 max_delay: float = DEFAULT_MAX_DELAY,
+                 max_puts_per_bucket: int = DEFAULT_MAX_PUTS_PER_BUCKET):
+        """
+        Args:
+            session (ArchiveSession): The session to ask check_limit with.
+            check_interval (float): Seconds a check_limit answer is reused.
+            base_delay (float): Backoff after the first overload, in seconds.
+            max_delay (float): Upper bound on the backoff, in seconds.
+            max_puts_per_bucket (int): Maximum number of PUTs to one item at a time.
+        """
+        self.session = session
+        self.check_interval = check_interval
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_puts_per_bucket = max_puts_per_bucket
+
+        self.checks = 0
+        self.cached_checks = 0
+        self.overloads = 0
+        self.backoff_seconds = 0.0
+        self.slot_wait_seconds = 0.0
+
+        # Guards the counters above and _buckets; bucket locks only guard bucket
+        # state.
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, _Bucket] = {}
+
+    def _bucket(self, identifier: str) -> _Bucket:
+        with self._lock:
+            bucket = self._buckets.get(identifier)
+            if bucket is None:
+                bucket = self._buckets[identifier] = _Bucket(self.max_puts_per_bucket)
+            return bucket
+
+    def _count(self, counter: str, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'checks': self.checks, 'cached_checks': self.cached_checks,
+                    'overloads': self.overloads,
+                    'backoff_seconds': round(self.backoff_seconds, 3),
+                    'slot_wait_seconds': round(self.slot_wait_seconds, 3)}
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Returns a jittered backoff for the attempt-th failure in a row (from 0):
+        between half and all of base_delay * 2 ** attempt, capped at max_delay.
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def is_overloaded(self, identifier: str, access_key: Optional[str] = None) -> bool:
+        """
+        Asks check_limit for the bucket, or returns its answer from the last
+        check_interval seconds.
+        """
+        bucket = self._bucket(identifier)
+        with bucket.lock:
+            now = time.monotonic()
+            if (bucket.checked_at is not None
+                    and now - bucket.checked_at < self.check_interval):
+                self._count('cached_checks')
+                return bucket.overloaded
+            self._count('checks')
+            bucket.overloaded = self.session.s3_is_overloaded(identifier=identifier,
+                                                              access_key=access_key)
+            bucket.checked_at = now
+            return bucket.overloaded
+
+    def record_overload(self, identifier: str) -> float:
+        """
+        Records a 503 or over_limit for the bucket and extends its backoff.
+
+        Returns:
+            float: The seconds until the bucket may be tried again.
+        """
+        bucket = self._bucket(identifier)
+        with bucket.lock:
+            self._count('overloads')
+            delay = self.backoff(bucket.consecutive_overloads)
+            bucket.consecutive_overloads += 1
+            now = time.monotonic()
+            bucket.blocked_until = max(bucket.blocked_until, now + delay)
+            # Ask check_limit afresh once the backoff is over, rather than trusting
+            # an answer from before the overload.
+            bucket.checked_at = None
+            return bucket.blocked_until - now
+
+    def record_success(self, identifier: str):
+        bucket = self._bucket(identifier)
+        with bucket.lock:
+            bucket.consecutive_overloads = 0
+
+    def wait(self, identifier: str, access_key: Optional[str] = None,
+             check: bool = True) -> bool:
+        """
+        Sleeps out the bucket's backoff, then optionally asks (the cached)
+        check_limit.
+
+        Returns:
+            bool: False if check_limit says the bucket is over its limit; the
+            overload is recorded and the caller should count a retry and call wait
+            again. True if the caller may send.
+        """
+        bucket = self._bucket(identifier)
+        with bucket.lock:
+            delay = bucket.blocked_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+            self._count('backoff_seconds', delay)
+        if check and self.is_overloaded(identifier, access_key):
+            self.record_overload(identifier)
+            return False
+        return True
+
+    @contextmanager
+    def put_slot(self, identifier: str):
+        """
+        Holds one of the bucket's max_puts_per_bucket PUT slots.
+        """
+        bucket = self._bucket(identifier)
+        start = time.monotonic()
+        bucket.puts.acquire()
+        self._count('slot_wait_seconds', time.monotonic() - start)
+        try:
+            yield
+        finally:
+            bucket.puts.release()
+
+
+def get_governor(session, **kwargs) -> S3Governor:
+    """
+    Returns the S3Governor attached to session as session.s3_governor, attaching
+    a new one with kwargs (see S3Governor) on first use.
+    """
+    with _governor_lock:
+        governor = getattr(session, 's3_governor', None)
+        if governor is None:
+            governor = session.s3_governor = S3Governor(session, **kwargs)
+        return governor
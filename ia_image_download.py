@@ -1,3 +1,4 @@
+from ia_metadata_cache import MetadataCache
 import os
 import requests
 from pathlib import Path
@@ -8,13 +9,16 @@ from typing import List
 class ImageDownloader:
     
     @staticmethod
-    def download_images_from_identifier(identifier: str, target_folder: Optional[str] = None):
+    def download_images_from_identifier(identifier: str,
+                                        target_folder: Optional[str] = None,
+                                        cache: Optional[MetadataCache] = None):
         """
         Downloads all image files (e.g., .jpg, .png) associated with an Internet Archive identifier.
 
         Args:
             identifier (str): The identifier of the Internet Archive item.
             target_folder (str): Optional. The directory where images will be downloaded.
+            cache (MetadataCache): Optional. Read the item's metadata through this cache.
         """
         home_directory = Path.home()  # Gets the user's home directory, e.g., '/Users/username'
         if target_folder is None:
@@ -26,9 +30,12 @@ class ImageDownloader:
         metadata_url = f"https://archive.org/metadata/{identifier}"
 
         try:
-            response = requests.get(metadata_url)
-            response.raise_for_status()
-            data = response.json()
+            if cache is not None:
+                data = cache.get_metadata(identifier)
+            else:
+                response = requests.get(metadata_url)
+                response.raise_for_status()
+                data = response.json()
 
             # Get the files section from the metadata
             files = data.get('files', [])
@@ -0,0 +1,215 @@
+from ia_scrape import ScrapeSearch
+from typing import Dict, List, Optional
+import os
+import sqlite3
+
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'ia_shows.sqlite')
+
+# Fields fetched from the scrape API and stored for every show.
+INDEX_FIELDS = ["identifier", "title", "date", "venue", "coverage", "transferer",
+                "avg_rating", "num_reviews", "source", "collection", "publicdate",
+                "addeddate"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shows (
+    rowid INTEGER PRIMARY KEY,
+    identifier TEXT UNIQUE NOT NULL,
+    title TEXT, date TEXT, venue TEXT, coverage TEXT, transferer TEXT, source TEXT,
+    avg_rating REAL, num_reviews INTEGER, publicdate TEXT, addeddate TEXT
+);
+CREATE INDEX IF NOT EXISTS shows_date ON shows (date);
+CREATE INDEX IF NOT EXISTS shows_venue ON shows (venue);
+CREATE INDEX IF NOT EXISTS shows_avg_rating ON shows (avg_rating);
+CREATE INDEX IF NOT EXISTS shows_num_reviews ON shows (num_reviews);
+
+CREATE TABLE IF NOT EXISTS show_collections (
+    identifier TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    PRIMARY KEY (collection, identifier)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS shows_fts USING fts5(
+    title, venue, coverage, transferer, source, content='shows', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS shows_ai AFTER INSERT ON shows BEGIN
+    INSERT INTO shows_fts (rowid, title, venue, coverage, transferer, source)
+    VALUES (new.rowid, new.title, new.venue, new.coverage, new.transferer, new.source);
+END;
+CREATE TRIGGER IF NOT EXISTS shows_au AFTER UPDATE ON shows BEGIN
+    INSERT INTO shows_fts (shows_fts, rowid, title, venue, coverage, transferer, source)
+    VALUES ('delete', old.rowid, old.title, old.venue, old.coverage, old.transferer,
+            old.source);
+    INSERT INTO shows_fts (rowid, title, venue, coverage, transferer, source)
+    VALUES (new.rowid, new.title, new.venue, new.coverage, new.transferer, new.source);
+END;
+
+CREATE TABLE IF NOT EXISTS syncs (
+    query TEXT PRIMARY KEY,
+    last_sync TEXT
+);
+"""
+
+
+def _text(value) -> Optional[str]:
+    # Scrape results hold a list for fields with several values.
+    if isinstance(value, list):
+        return '; '.join(str(v) for v in value)
+    return value
+
+
+def _number(value, convert):
+    if isinstance(value, list):
+        value = value[0] if value else None
+    try:
+        return convert(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+class ShowIndex:
+    """
+    Local SQLite index of search results, for answering SearchTermsModel queries
+    without going to archive.org.
+
+    Shows are ingested from the scrape API, one query (usually a collection) at a
+    time. Later syncs of the same query only fetch items published since the last
+    one. Title, venue, coverage, transferer and source are full-text indexed; date,
+    venue, avg_rating and num_reviews have B-tree indexes.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    def sync(self, session, query: str, since_field: str = 'publicdate',
+             count: int = 10000) -> int:
+        """
+        Ingests the results of query, or only those added since its last sync.
+
+        Args:
+            session (ArchiveSession): The session to scrape with.
+            query (str): The search query, e.g. 'collection:GratefulDead'.
+            since_field (str): The date field compared with the last sync,
+                               'publicdate' or 'addeddate'.
+            count (int): Number of results per scrape page.
+
+        Returns:
+            int: The number of shows ingested.
+        """
+        row = self._db.execute('SELECT last_sync FROM syncs WHERE query = ?',
+                               (query,)).fetchone()
+        scrape_query = query
+        if row and row['last_sync']:
+            # Inclusive and by day, so shows published the same day are not missed;
+            # ingesting a show twice only updates it.
+            scrape_query = f'({query}) AND {since_field}:[{row["last_sync"][:10]} TO *]'
+        last_sync = row['last_sync'] if row else None
+
+        ingested = 0
+        for item in ScrapeSearch(session, scrape_query, fields=INDEX_FIELDS, count=count):
+            self._upsert(item)
+            ingested += 1
+            since = _text(item.get(since_field))
+            if since and (last_sync is None or since > last_sync):
+                last_sync = since
+
+        self._db.execute('INSERT INTO syncs VALUES (?, ?) ON CONFLICT (query) '
+                         'DO UPDATE SET last_sync = excluded.last_sync',
+                         (query, last_sync))
+        self._db.commit()
+        return ingested
+
+    def _upsert(self, item: dict):
+        values = {field: _text(item.get(field)) for field in
+                  ["identifier", "title", "date", "venue", "coverage", "transferer",
+                   "source", "publicdate", "addeddate"]}
+        values['avg_rating'] = _number(item.get('avg_rating'), float)
+        values['num_reviews'] = _number(item.get('num_reviews'), int)
+        columns = ', '.join(values)
+        updates = ', '.join(f'{c} = excluded.{c}' for c in values if c != 'identifier')
+        self._db.execute(
+            f'INSERT INTO shows ({columns}) VALUES ({", ".join("?" for _ in values)}) '
+            f'ON CONFLICT (identifier) DO UPDATE SET {updates}',
+            list(values.values()))
+
+        collections = item.get('collection') or []
+        if not isinstance(collections, list):
+            collections = [collections]
+        self._db.execute('DELETE FROM show_collections WHERE identifier = ?',
+                         (values['identifier'],))
+        self._db.executemany('INSERT OR IGNORE INTO show_collections VALUES (?, ?)',
+                             [(values['identifier'], c) for c in collections])
+
+    def search(self, search_terms) -> List[Dict[str, str]]:
+        """
+        Answers a SearchTermsModel from the index.
+
+        The collection expression is read as collections joined by AND, all of
+        which a show has to be in. Search term, venue and transferer are phrase
+        matches, as they are on archive.org.
+
+        Args:
+            search_terms (SearchTermsModel): The parameters to use for the search.
+
+        Returns:
+            List[Dict[str, str]]: The matching shows, ordered by date, with the
+            fields perform_archive_search asks archive.org for.
+        """
+        where = []
+        params = []
+
+        collection = search_terms.collection
+        if not collection:
+            collection = 'GratefulDead AND stream_only' if search_terms.sbd_only \
+                else 'GratefulDead'
+        for name in collection.split(' AND '):
+            where.append('s.identifier IN '
+                         '(SELECT identifier FROM show_collections WHERE collection = ?)')
+            params.append(name.strip().strip('()'))
+
+        match = []
+        if search_terms.search_term:
+            match.append(_phrase(search_terms.search_term))
+        if search_terms.venue:
+            match.append(f'venue : {_phrase(search_terms.venue)}')
+        if search_terms.transferer:
+            match.append(f'transferer : {_phrase(search_terms.transferer)}')
+        if match:
+            where.append('s.rowid IN '
+                         '(SELECT rowid FROM shows_fts WHERE shows_fts MATCH ?)')
+            params.append(' AND '.join(match))
+
+        if search_terms.start_year or search_terms.end_year:
+            start = search_terms.start_year if search_terms.start_year else "1965"
+            end = search_terms.end_year if search_terms.end_year else "1995"
+            # Dates carry a time part, so compare against the start of the next year.
+            where.append('s.date >= ? AND s.date < ?')
+            params.extend([f'{start}-01-01', f'{int(end) + 1}-01-01'])
+
+        if search_terms.min_rating:
+            where.append('s.avg_rating >= ?')
+            params.append(float(search_terms.min_rating))
+
+        if search_terms.num_reviews:
+            where.append('s.num_reviews >= ?')
+            params.append(int(search_terms.num_reviews))
+
+        rows = self._db.execute(
+            'SELECT identifier, title, date, venue, coverage, transferer, avg_rating, '
+            f'num_reviews, source FROM shows s WHERE {" AND ".join(where)} ORDER BY date',
+            params)
+        # Leave out missing fields, as scrape results do.
+        return [{key: row[key] for key in row.keys() if row[key] is not None}
+                for row in rows]
+
+    def close(self):
+        self._db.close()
@@ -1,5 +1,7 @@
+from ia_metadata_cache import MetadataCache
+from ia_session import get_items_bulk, get_pooled_session
 import requests
-from typing import Optional, List
+from typing import Optional, List, Iterable
 
 
 class ShowMetadata:
@@ -26,12 +28,13 @@ class ShowMetadata:
         self.notes = notes
 
     @classmethod
-    def from_identifier(cls, identifier: str):
+    def from_identifier(cls, identifier: str, cache: Optional[MetadataCache] = None):
         """
         Fetch metadata for a given identifier and return an instance of ShowMetadata.
 
         Args:
             identifier (str): The identifier of the Internet Archive item.
+            cache (MetadataCache): Optional. Read the metadata through this cache.
 
         Returns:
             ShowMetadata: An instance of ShowMetadata with the fetched metadata.
@@ -40,33 +43,71 @@ class ShowMetadata:
         url = f"{base_url}{identifier}"
 
         try:
-            response = requests.get(url)
-            response.raise_for_status()  # Raise an error for bad responses
-            data = response.json()
+            if cache is not None:
+                data = cache.get_metadata(identifier)
+            else:
+                response = requests.get(url)
+                response.raise_for_status()  # Raise an error for bad responses
+                data = response.json()
 
             metadata = data.get('metadata', {})
             print(metadata)
-            # Extract fields from the metadata
-            return cls(
-                identifier=identifier,
-                title=metadata.get('title'),
-                creator=metadata.get('creator'),
-                mediatype=metadata.get('mediatype'),
-                collection=metadata.get('collection'),
-                item_type=metadata.get('type'),
-                description=metadata.get('description'),
-                date=metadata.get('date'),
-                year=metadata.get('year'),
-                venue=metadata.get('venue'),
-                transferer=metadata.get('transferer'),
-                source=metadata.get('source'),
-                coverage=metadata.get('coverage'),
-                notes=metadata.get('notes')
-            )
+            return cls.from_metadata(identifier, metadata)
         except requests.RequestException as e:
             print(f"Failed to fetch metadata for identifier '{identifier}': {e}")
             return None
 
+    @classmethod
+    def from_metadata(cls, identifier: str, metadata: dict):
+        """
+        Create an instance of ShowMetadata from an item's metadata dict.
+        """
+        # Extract fields from the metadata
+        return cls(
+            identifier=identifier,
+            title=metadata.get('title'),
+            creator=metadata.get('creator'),
+            mediatype=metadata.get('mediatype'),
+            collection=metadata.get('collection'),
+            item_type=metadata.get('type'),
+            description=metadata.get('description'),
+            date=metadata.get('date'),
+            year=metadata.get('year'),
+            venue=metadata.get('venue'),
+            transferer=metadata.get('transferer'),
+            source=metadata.get('source'),
+            coverage=metadata.get('coverage'),
+            notes=metadata.get('notes')
+        )
+
+    @classmethod
+    def from_identifiers(cls, identifiers: Iterable[str], workers: int = 8,
+                         session=None) -> List[Optional['ShowMetadata']]:
+        """
+        Fetch metadata for many identifiers concurrently.
+
+        Args:
+            identifiers (Iterable[str]): The identifiers of the Internet Archive items.
+            workers (int): Number of metadata requests to run at the same time.
+            session (ArchiveSession): Optional. The session to fetch with.
+
+        Returns:
+            List[Optional[ShowMetadata]]: One entry per identifier, in input order;
+            None for identifiers whose metadata could not be fetched.
+        """
+        if session is None:
+            session = get_pooled_session(pool_maxsize=max(workers, 10))
+
+        shows = []
+        for identifier, item in get_items_bulk(session, identifiers, workers=workers,
+                                               ordered=True):
+            if isinstance(item, Exception):
+                print(f"Failed to fetch metadata for identifier '{identifier}': {item}")
+                shows.append(None)
+            else:
+                shows.append(cls.from_metadata(identifier, item.metadata))
+        return shows
+
     def __str__(self):
         """
         String representation of the ShowMetadata object for easy printing.
@@ -0,0 +1,158 @@
+from internetarchive.auth import S3Auth
+from typing import Optional
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import requests
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache',
+                                  'ia_metadata.sqlite')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Entries younger than this are used without asking archive.org.
+DEFAULT_TTL = 24 * 60 * 60
+
+METADATA_URL = 'https://archive.org/metadata/'
+
+
+class MetadataCache:
+    """
+    On-disk cache of /metadata/<identifier> responses.
+
+    Responses are stored zlib-compressed in SQLite. Fresh entries (younger than
+    ttl) are returned as they are; stale ones are revalidated with If-None-Match /
+    If-Modified-Since, so unchanged items cost a 304 rather than the full JSON.
+    Unknown identifiers ({}) are not stored.
+    When the compressed entries outgrow max_bytes, the least recently used ones
+    are evicted; their total size is tracked as entries are written, so this
+    only scans the table when something has to go. Safe to share between
+    threads.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl: float = DEFAULT_TTL, session=None, timeout: int = 12,
+                 metadata_url: str = METADATA_URL, auth: Optional[S3Auth] = None):
+        """
+        Args:
+            path (str): The SQLite database to keep the cache in.
+            max_bytes (int): Upper bound on the size of the compressed entries.
+            ttl (float): Seconds an entry is used before it is revalidated.
+            session (requests.Session): Optional. The session to fetch with.
+            timeout (int): Timeout in seconds for every request.
+            metadata_url (str): The metadata API base URL.
+            auth (S3Auth): Optional. Auth for every request, so dark and private
+                           items are readable. Defaults to the S3 keys of session,
+                           as internetarchive.catalog.Catalog does.
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.session = session if session is not None else requests.Session()
+        self.timeout = timeout
+        self.metadata_url = metadata_url
+        if auth is None and getattr(self.session, 'access_key', None) \
+                and getattr(self.session, 'secret_key', None):
+            auth = S3Auth(self.session.access_key, self.session.secret_key)
+        self.auth = auth
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.refreshed = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS metadata ('
+                         'identifier TEXT PRIMARY KEY, body BLOB, size INTEGER, '
+                         'etag TEXT, last_modified TEXT, fetched_at REAL, '
+                         'last_used REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS metadata_last_used '
+                         'ON metadata (last_used)')
+        self._db.commit()
+        self._total_bytes = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM metadata').fetchone()[0]
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses,
+                'revalidated': self.revalidated, 'refreshed': self.refreshed}
+
+    def get_metadata(self, identifier: str) -> dict:
+        """
+        Returns the metadata of an item, from cache when it is fresh or unchanged.
+
+        Raises:
+            requests.RequestException: If the item had to be fetched and that failed.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                'SELECT body, etag, last_modified, fetched_at FROM metadata '
+                'WHERE identifier = ?', (identifier,)).fetchone()
+            if row and now - row[3] < self.ttl:
+                self.hits += 1
+                self._db.execute('UPDATE metadata SET last_used = ? WHERE identifier = ?',
+                                 (now, identifier))
+                self._db.commit()
+                return json.loads(zlib.decompress(row[0]))
+
+        headers = {}
+        if row and row[1]:
+            headers['If-None-Match'] = row[1]
+        if row and row[2]:
+            headers['If-Modified-Since'] = row[2]
+        response = self.session.get(self.metadata_url + identifier, headers=headers,
+                                    auth=self.auth, timeout=self.timeout)
+
+        with self._lock:
+            if row and response.status_code == 304:
+                self.revalidated += 1
+                self._db.execute('UPDATE metadata SET fetched_at = ?, last_used = ? '
+                                 'WHERE identifier = ?', (now, now, identifier))
+                self._db.commit()
+                return json.loads(zlib.decompress(row[0]))
+
+            response.raise_for_status()
+            metadata = response.json()
+            if row:
+                self.refreshed += 1
+            else:
+                self.misses += 1
+            if metadata:
+                # Unknown identifiers return {}; those are not worth keeping.
+                body = zlib.compress(response.content)
+                replaced = self._db.execute(
+                    'SELECT size FROM metadata WHERE identifier = ?',
+                    (identifier,)).fetchone()
+                self._db.execute(
+                    'INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (identifier, body, len(body), response.headers.get('ETag'),
+                     response.headers.get('Last-Modified'), now, now))
+                self._total_bytes += len(body) - (replaced[0] if replaced else 0)
+                if self._total_bytes > self.max_bytes:
+                    self._evict()
+                self._db.commit()
+            return metadata
+
+    def _evict(self):
+        excess = self._total_bytes - self.max_bytes
+        rows = self._db.execute('SELECT identifier, size FROM metadata '
+                                'ORDER BY last_used')
+        evict = []
+        for identifier, size in rows:
+            if excess <= 0:
+                break
+            evict.append((identifier,))
+            excess -= size
+            self._total_bytes -= size
+        self._db.executemany('DELETE FROM metadata WHERE identifier = ?', evict)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,301 @@
+from ia_file_download import RESUMABLE_ERRORS, _read_journal, _remove, _write_journal
+from ia_governor import get_governor
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from internetarchive.auth import S3Auth
+from internetarchive.iarequest import S3Request
+from requests.exceptions import HTTPError
+from typing import Callable, Dict, Optional
+from urllib.parse import quote
+from xml.etree import ElementTree
+import hashlib
+import os
+import threading
+import time
+
+
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ia_multipart')
+
+# S3 parts must be at least 5 MiB (except the last), and an upload has at most
+# 10000 parts.
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+DEFAULT_PART_SIZE = 64 * 1024 * 1024
+
+# Files from this size on are uploaded in parts.
+DEFAULT_MULTIPART_THRESHOLD = 256 * 1024 * 1024
+
+
+def _xml_text(content: bytes, tag: str) -> Optional[str]:
+    # S3 responses are namespaced; match on the local tag name.
+    for element in ElementTree.fromstring(content).iter():
+        if element.tag.rsplit('}', 1)[-1] == tag:
+            return element.text
+    return None
+
+
+def journal_path_for(identifier: str, key: str, path: str,
+                     journal_dir: str = DEFAULT_JOURNAL_DIR) -> str:
+    name = f'{identifier}/{key}\0{os.path.abspath(path)}'
+    name = hashlib.sha1(name.encode()).hexdigest()
+    return os.path.join(journal_dir, name + '.json')
+
+
+def part_size_for(size: int, part_size: int = DEFAULT_PART_SIZE) -> int:
+    """
+    Returns part_size, raised where needed so size fits in MAX_PARTS parts.
+    """
+    part_size = max(part_size, MIN_PART_SIZE)
+    return max(part_size, -(-size // MAX_PARTS))
+
+
+class MultipartUpload:
+    """
+    One IA-S3 multipart upload: initiate, upload parts concurrently, complete.
+
+    Every part is sent with its Content-MD5, so S3 rejects a corrupted part, and
+    the ETag S3 returns for it is checked against the local md5. Completed parts
+    are recorded in a JSON journal, so running the upload again after an
+    interruption only sends the parts that are missing. The journal is only
+    reused while the local file has the size and mtime it had when the upload
+    was initiated.
+    """
+
+    def __init__(self, item, path: str, key: str, part_size: int = DEFAULT_PART_SIZE,
+                 metadata: Optional[dict] = None, file_metadata: Optional[dict] = None,
+                 headers: Optional[dict] = None, queue_derive: bool = True,
+                 access_key: Optional[str] = None, secret_key: Optional[str] = None,
+                 journal_dir: str = DEFAULT_JOURNAL_DIR, timeout: int = 120):
+        """
+        Args:
+            item (Item): The item to upload to.
+            path (str): The local file.
+            key (str): The remote file name.
+            part_size (int): Bytes per part; raised if the file would need more
+                             than MAX_PARTS parts.
+            metadata (dict): Optional. Item metadata, used if the item is created.
+            file_metadata (dict): Optional. files.xml metadata for the file.
+            headers (dict): Optional. Extra IA-S3 headers for the initiate request.
+            queue_derive (bool): If True, queue a derive when the upload completes.
+            access_key (str): Optional. IA-S3 access key, defaults to the session's.
+            secret_key (str): Optional. IA-S3 secret key, defaults to the session's.
+            journal_dir (str): Where to keep the journals of unfinished uploads.
+            timeout (int): Timeout in seconds for every request.
+        """
+        self.item = item
+        self.session = item.session
+        self.path = path
+        self.key = key
+        st = os.stat(path)
+        self.size = st.st_size
+        self.mtime_ns = st.st_mtime_ns
+        self.part_size = part_size_for(self.size, part_size)
+        self.metadata = metadata
+        self.file_metadata = file_metadata
+        self.headers = headers or {}
+        self.queue_derive = queue_derive
+        self.access_key = access_key or self.session.access_key
+        self.secret_key = secret_key or self.session.secret_key
+        self.auth = S3Auth(self.access_key, self.secret_key)
+        self.governor = get_governor(self.session)
+        self.timeout = timeout
+        self.url = (f"{self.session.protocol}//s3.us.archive.org/{item.identifier}/"
+                    f"{quote(key.lstrip('/').encode('utf-8'))}")
+
+        os.makedirs(journal_dir, exist_ok=True)
+        self.journal_path = journal_path_for(item.identifier, key, path, journal_dir)
+        self.journal = _read_journal(self.journal_path)
+        if (self.journal.get('size') != self.size
+                or self.journal.get('mtime_ns') != self.mtime_ns
+                or self.journal.get('part_size') != self.part_size):
+            self.journal = {}
+        self._lock = threading.Lock()
+
+    @property
+    def num_parts(self) -> int:
+        return max(1, -(-self.size // self.part_size))
+
+    @property
+    def completed_parts(self) -> Dict[int, str]:
+        return {int(n): etag for n, etag in self.journal.get('parts', {}).items()}
+
+    def _send(self, method: str, params: dict, data=b'', headers=None, queue_derive=False,
+              metadata=None, file_metadata=None):
+        request = S3Request(method=method, url=self.url, params=params, data=data,
+                            headers=dict(headers or {}), metadata=metadata,
+                            file_metadata=file_metadata, queue_derive=queue_derive,
+                            auth=self.auth, set_scanner=metadata is not None)
+        response = self.session.send(request.prepare(), timeout=self.timeout)
+        response.raise_for_status()
+        # S3 can report a failed complete with 200 and an Error document.
+        content = response.content
+        if content.lstrip().startswith(b'<?xml') and b'<Error>' in content:
+            message = _xml_text(content, 'Message')
+            raise HTTPError(f"{method} {self.key}: {message}", response=response)
+        return response
+
+    def initiate(self) -> str:
+        """
+        Starts the upload on S3, unless the journal holds one to resume.
+
+        Returns:
+            str: The upload id.
+        """
+        if self.journal.get('upload_id'):
+            return self.journal['upload_id']
+        headers = dict(self.headers)
+        headers.setdefault('x-archive-size-hint', str(self.size))
+        response = self._send('POST', {'uploads': ''}, headers=headers,
+                              metadata=dict(self.metadata or {}),
+                              file_metadata=self.file_metadata)
+        upload_id = _xml_text(response.content, 'UploadId')
+        if not upload_id:
+            raise ValueError(f"no UploadId in the response to initiating {self.key}")
+        self.journal = {'identifier': self.item.identifier, 'key': self.key,
+                        'path': os.path.abspath(self.path), 'size': self.size,
+                        'mtime_ns': self.mtime_ns, 'part_size': self.part_size,
+                        'upload_id': upload_id, 'parts': {}}
+        _write_journal(self.journal_path, self.journal)
+        return upload_id
+
+    def upload_part(self, number: int, retries: int = 5) -> str:
+        """
+        Uploads part number (1-based) and records its ETag in the journal.
+
+        Attempts are paced by the session's S3Governor like single-PUT uploads: 503s
+        and over_limit answers back off every upload to the item, and the part
+        counts against the item's concurrent PUT cap. A dropped connection is
+        retried after a backoff of its own.
+
+        Args:
+            number (int): The part number.
+            retries (int): Number of times to retry on 503 or a dropped connection.
+
+        Returns:
+            str: The part's ETag.
+        """
+        offset = (number - 1) * self.part_size
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(min(self.part_size, self.size - offset))
+        md5 = hashlib.md5(data)
+        # Hex, not AWS's base64: IA-S3 checks Content-MD5 as the hex digest that
+        # Item.upload_file and single-PUT uploads (ia_upload) send.
+        headers = {'Content-MD5': md5.hexdigest()}
+        params = {'partNumber': number, 'uploadId': self.journal['upload_id']}
+        identifier = self.item.identifier
+
+        attempt = 0
+        while True:
+            if not self.governor.wait(identifier, self.access_key, check=retries > 0):
+                retries -= 1
+                continue
+            try:
+                with self.governor.put_slot(identifier):
+                    response = self.session.put(self.url, params=params, data=data,
+                                                headers=headers, auth=self.auth,
+                                                timeout=self.timeout)
+                    response.raise_for_status()
+                self.governor.record_success(identifier)
+                break
+            except RESUMABLE_ERRORS + (HTTPError,) as exc:
+                status = getattr(getattr(exc, 'response', None), 'status_code', None)
+                if retries <= 0 or (isinstance(exc, HTTPError) and status != 503):
+                    raise
+                if status == 503:
+                    delay = self.governor.record_overload(identifier)
+                else:
+                    delay = self.governor.backoff(attempt)
+                    time.sleep(delay)
+                print(f" warning: part {number} of {self.key} failed ({exc}), "
+                      f"backing off {delay:.1f} seconds. {retries} retries left.")
+                retries -= 1
+                attempt += 1
+
+        etag = response.headers.get('ETag', '').strip('"')
+        if etag and etag != md5.hexdigest():
+            raise ValueError(f"part {number} of {self.key}: S3 returned ETag {etag}, "
+                             f"the part's md5 is {md5.hexdigest()}")
+        with self._lock:
+            self.journal['parts'][str(number)] = etag or md5.hexdigest()
+            _write_journal(self.journal_path, self.journal)
+        return etag
+
+    def complete(self):
+        """
+        Assembles the uploaded parts into the file and removes the journal.
+        """
+        parts = ''.join(f'<Part><PartNumber>{n}</PartNumber><ETag>"{etag}"</ETag></Part>'
+                        for n, etag in sorted(self.completed_parts.items()))
+        body = f'<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>'
+        response = self._send('POST', {'uploadId': self.journal['upload_id']},
+                              data=body.encode('utf-8'), queue_derive=self.queue_derive)
+        _remove(self.journal_path)
+        return response
+
+    def abort(self):
+        """
+        Cancels the upload on S3 and removes the journal.
+        """
+        if self.journal.get('upload_id'):
+            self.session.delete(self.url, params={'uploadId': self.journal['upload_id']},
+                                auth=self.auth, timeout=self.timeout)
+        _remove(self.journal_path)
+        self.journal = {}
+
+    def upload(self, workers: int = 4, retries: int = 5,
+               progress: Optional[Callable[[int, int], None]] = None):
+        """
+        Runs the whole upload, or what is left of it, and completes it.
+
+        Up to workers parts are read into memory and sent at the same time. If S3
+        no longer knows the upload the journal points to, it starts over.
+
+        Args:
+            workers (int): Number of parts to upload concurrently.
+            retries (int): Number of times to retry a part; see upload_part.
+            progress (Callable[[int, int], None]): Optional. Called with the bytes
+                                                   uploaded so far and the file
+                                                   size, at the start and as every
+                                                   part completes.
+
+        Returns:
+            Response: The response to the complete request.
+        """
+        resuming = bool(self.journal.get('upload_id'))
+        try:
+            return self._upload(workers, retries, progress)
+        except HTTPError as exc:
+            if not resuming or getattr(exc.response, 'status_code', None) != 404:
+                raise
+            print(f" upload of {self.key} expired on S3, starting over")
+            _remove(self.journal_path)
+            self.journal = {}
+            return self._upload(workers, retries, progress)
+
+    def _part_length(self, number: int) -> int:
+        return min(self.part_size, self.size - (number - 1) * self.part_size)
+
+    def _upload(self, workers, retries, progress):
+        self.initiate()
+        missing = [n for n in range(1, self.num_parts + 1)
+                   if n not in self.completed_parts]
+        if missing and len(missing) < self.num_parts:
+            print(f" resuming {self.key}: {self.num_parts - len(missing)} of "
+                  f"{self.num_parts} parts already uploaded")
+        sent = sum(self._part_length(n) for n in self.completed_parts)
+        if progress is not None:
+            progress(sent, self.size)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.upload_part, n, retries): n for n in missing}
+            try:
+                # Report parts in the order they finish, from this thread only.
+                for future in as_completed(futures):
+                    future.result()
+                    sent += self._part_length(futures[future])
+                    if progress is not None:
+                        progress(sent, self.size)
+            except Exception:
+                for pending in futures:
+                    pending.cancel()
+                raise
+        return self.complete()
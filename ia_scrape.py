@@ -0,0 +1,305 @@
+from concurrent.futures import ThreadPoolExecutor
+from ia_session import get_items_bulk
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import queue
+import threading
+
+
+# The scrape API accepts between 100 and 10000 items per page.
+DEFAULT_PAGE_SIZE = 10000
+
+# How many pages a background thread may fetch ahead of the consumer.
+DEFAULT_PREFETCH = 2
+
+# Archive.org identifiers start with a letter or a digit.
+IDENTIFIER_FIRST_CHARACTERS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+_DONE = object()
+
+
+class PartitionMismatchError(Exception):
+    """
+    Raised after merging partitions of a search whose totals do not add up to the
+    search's own: partitions overlap, or some items are in none of them.
+    """
+
+    def __init__(self, total: int, expected_total: int):
+        super().__init__(f"partitions matched {total} items in total, but the query "
+                         f"matches {expected_total}")
+        self.total = total
+        self.expected_total = expected_total
+
+
+def prefetch(iterable: Iterable, depth: int) -> Iterator:
+    """
+    Iterates over iterable in a background thread, staying up to depth items ahead.
+
+    Exceptions raised by the iterable are re-raised in the consuming thread. When
+    the consumer stops early, the background thread stops at its next item.
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except Exception as exc:
+            put((None, exc))
+            return
+        put((_DONE, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, exc = items.get()
+            if exc is not None:
+                raise exc
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def identifier_prefix_clauses(partitions: int) -> List[str]:
+    """
+    Splits identifiers into disjoint groups by their first character.
+
+    Upper and lower case of a letter always land in the same group, so the
+    groups stay disjoint however the search index treats case.
+
+    Returns:
+        List[str]: One 'identifier:(a* OR A* OR ...)' clause per group.
+    """
+    if partitions < 1:
+        raise ValueError(f"partitions must be at least 1, not {partitions}")
+    size = -(-len(IDENTIFIER_FIRST_CHARACTERS) // partitions)
+    clauses = []
+    for i in range(0, len(IDENTIFIER_FIRST_CHARACTERS), size):
+        prefixes = []
+        for c in IDENTIFIER_FIRST_CHARACTERS[i:i + size]:
+            prefixes.extend([c, c.upper()] if c.isalpha() else [c])
+        clauses.append('identifier:(' + ' OR '.join(f'{p}*' for p in prefixes) + ')')
+    return clauses
+
+
+def date_range_clauses(start_year: int, end_year: int, partitions: int) -> List[str]:
+    """
+    Splits the years start_year to end_year into contiguous, disjoint date ranges.
+
+    Returns:
+        List[str]: One 'date:[YYYY-01-01 TO YYYY-12-31]' clause per range.
+    """
+    if partitions < 1:
+        raise ValueError(f"partitions must be at least 1, not {partitions}")
+    years = list(range(int(start_year), int(end_year) + 1))
+    size = -(-len(years) // partitions)
+    return [f'date:[{years[i]}-01-01 TO {years[min(i + size, len(years)) - 1]}-12-31]'
+            for i in range(0, len(years), size)]
+
+
+def iter_merged(searches: List['ScrapeSearch'], dedup: bool = True,
+                expected_total: Optional[int] = None) -> Iterator[dict]:
+    """
+    Scrapes several searches concurrently, yielding items as their pages arrive.
+
+    Args:
+        searches (List[ScrapeSearch]): The searches to run, one thread each.
+        dedup (bool): If True, yield every identifier only once.
+        expected_total (int): Optional. If given, the searches' combined totals are
+                              compared with it once they are done.
+
+    Raises:
+        PartitionMismatchError: Once every item has been yielded, if the totals
+                                differ from expected_total (an overlap, or items
+                                no partition covers).
+    """
+    pages = queue.Queue(maxsize=2 * len(searches))
+    stop = threading.Event()
+
+    def put(page):
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def run(search):
+        try:
+            for page in search.iter_pages():
+                if stop.is_set():
+                    return
+                put((page, None))
+        except Exception as exc:
+            put((None, exc))
+            return
+        put((_DONE, None))
+
+    seen = set()
+    executor = ThreadPoolExecutor(max_workers=len(searches))
+    try:
+        for search in searches:
+            executor.submit(run, search)
+        remaining = len(searches)
+        while remaining:
+            page, exc = pages.get()
+            if exc is not None:
+                raise exc
+            if page is _DONE:
+                remaining -= 1
+                continue
+            for item in page:
+                if dedup:
+                    if item['identifier'] in seen:
+                        continue
+                    seen.add(item['identifier'])
+                yield item
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
+
+    if expected_total is not None:
+        total = sum(search.num_found for search in searches)
+        if total != expected_total:
+            raise PartitionMismatchError(total, expected_total)
+
+
+class ScrapeSearch:
+    """
+    Enumerates the results of an archive.org search with the scrape API.
+
+    Unlike internetarchive.search_items, the next page can be fetched in the
+    background while the current one is being consumed, so enumerating a large
+    collection is bound by bandwidth rather than by one round trip per page.
+    """
+
+    def __init__(self, session, query: str, fields: Optional[List[str]] = None,
+                 sorts: Optional[List[str]] = None, count: int = DEFAULT_PAGE_SIZE,
+                 prefetch: int = DEFAULT_PREFETCH, timeout: int = 300):
+        """
+        Args:
+            session (ArchiveSession): The session to search with.
+            query (str): The search query.
+            fields (List[str]): Optional. Metadata fields to return for every item.
+                                'identifier' is always included.
+            sorts (List[str]): Optional. Sort order, e.g. ['date asc'].
+            count (int): Number of items per page (100 to 10000).
+            prefetch (int): Number of pages to fetch ahead of the consumer; 0 fetches
+                            each page only when the previous one is used up.
+            timeout (int): Read timeout in seconds for each page request.
+        """
+        self.session = session
+        self.query = query
+        self.fields = ['identifier'] + [f for f in (fields or []) if f != 'identifier']
+        self.sorts = sorts
+        self.count = count
+        self.prefetch = prefetch
+        self.timeout = timeout
+        self.url = f"{session.protocol}//{session.host}/services/search/v1/scrape"
+        self._num_found = None
+
+    def _request(self, params: Dict[str, str]) -> dict:
+        response = self.session.post(self.url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        j = response.json()
+        if j.get('error'):
+            raise ValueError(f"scrape request failed for query '{self.query}': "
+                             f"{j['error']}")
+        return j
+
+    @property
+    def num_found(self) -> int:
+        """
+        The total number of items matching the query.
+        """
+        if self._num_found is None:
+            j = self._request({'q': self.query, 'total_only': 'true'})
+            self._num_found = j['total']
+        return self._num_found
+
+    def iter_pages(self) -> Iterator[List[dict]]:
+        """
+        Yields the results one page at a time, fetching pages one after another.
+        """
+        params = {'q': self.query, 'fields': ','.join(self.fields), 'count': self.count}
+        if self.sorts:
+            params['sorts'] = ','.join(self.sorts)
+        while True:
+            j = self._request(params)
+            if 'total' in j:
+                self._num_found = j['total']
+            yield j.get('items', [])
+            if 'cursor' not in j:
+                return
+            params['cursor'] = j['cursor']
+
+    def partition(self, partitions: int, by: str = 'identifier',
+                  years: Tuple[int, int] = (1965, 1995)) -> List['ScrapeSearch']:
+        """
+        Splits this search into disjoint searches.
+
+        Args:
+            partitions (int): Number of searches to split into.
+            by (str): 'identifier' to split by identifier prefix, or 'date' to split
+                      the years in years into date ranges. Items without a date in
+                      that range are not covered by any 'date' partition.
+            years (Tuple[int, int]): First and last year to cover when splitting by date.
+
+        Returns:
+            List[ScrapeSearch]: The searches, in the order of their partitions.
+        """
+        if by == 'identifier':
+            clauses = identifier_prefix_clauses(partitions)
+        elif by == 'date':
+            clauses = date_range_clauses(years[0], years[1], partitions)
+        else:
+            raise ValueError(f"cannot partition by '{by}', use 'identifier' or 'date'")
+        return [ScrapeSearch(self.session, f'({self.query}) AND {clause}', self.fields,
+                             self.sorts, self.count, prefetch=0, timeout=self.timeout)
+                for clause in clauses]
+
+    def iter_parallel(self, partitions: int = 4, by: str = 'identifier',
+                      years: Tuple[int, int] = (1965, 1995), dedup: bool = True,
+                      check_total: bool = True) -> Iterator[dict]:
+        """
+        Scrapes disjoint partitions of this search concurrently and merges the results.
+
+        Items are yielded as their pages arrive, not in the order of a single scrape.
+        See partition for the arguments partitions, by and years.
+
+        Args:
+            dedup (bool): If True, yield every identifier only once.
+            check_total (bool): If True, raise PartitionMismatchError when the
+                                partitions' totals do not add up to num_found.
+        """
+        expected_total = self.num_found if check_total else None
+        return iter_merged(self.partition(partitions, by, years), dedup, expected_total)
+
+    def iter_as_items(self, workers: int = 8,
+                      ordered: bool = True) -> Iterator[Tuple[str, object]]:
+        """
+        Yields an Item for every result, fetching their metadata concurrently while
+        the search is still running. See ia_session.get_items_bulk.
+        """
+        identifiers = (item['identifier'] for item in self)
+        return get_items_bulk(self.session, identifiers, workers=workers, ordered=ordered)
+
+    def __iter__(self) -> Iterator[dict]:
+        pages = self.iter_pages()
+        if self.prefetch > 0:
+            pages = prefetch(pages, self.prefetch)
+        for page in pages:
+            yield from page
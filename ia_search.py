@@ -1,5 +1,8 @@
-import internetarchive
+from ia_index import ShowIndex
+from ia_scrape import ScrapeSearch, DEFAULT_PAGE_SIZE, DEFAULT_PREFETCH, iter_merged
+from ia_session import get_pooled_session
 from typing import Optional, List, Dict
+import copy
 
 
 class SearchTermsModel:
@@ -50,16 +53,61 @@ class SearchTermsModel:
 
         return query
 
+    def partition(self, partitions: int) -> List['SearchTermsModel']:
+        """
+        Splits the year range into contiguous, disjoint ranges, one model per range.
+
+        Together the models' queries match the same shows as this model's query.
+        Only a model with a start or end year can be split this way: without one
+        its query has no date clause, and date ranges would drop undated shows.
 
-def perform_archive_search(search_terms: SearchTermsModel) -> List[Dict[str, str]]:
+        Raises:
+            ValueError: If partitions is less than 1, or no year is set.
+        """
+        if partitions < 1:
+            raise ValueError(f"partitions must be at least 1, not {partitions}")
+        if not (self.start_year or self.end_year):
+            raise ValueError("cannot partition a search without a start or end year")
+        start = int(self.start_year if self.start_year else "1965")
+        end = int(self.end_year if self.end_year else "1995")
+        years = list(range(start, end + 1))
+        size = -(-len(years) // partitions)
+
+        models = []
+        for i in range(0, len(years), size):
+            model = copy.copy(self)
+            model.start_year = str(years[i])
+            model.end_year = str(years[min(i + size, len(years)) - 1])
+            models.append(model)
+        return models
+
+
+def perform_archive_search(search_terms: SearchTermsModel, session=None,
+                           count: int = DEFAULT_PAGE_SIZE,
+                           prefetch: int = DEFAULT_PREFETCH,
+                           partitions: int = 1,
+                           index: Optional[ShowIndex] = None) -> List[Dict[str, str]]:
     """
     Performs a search in the Internet Archive based on given search terms.
 
     Args:
         search_terms (SearchTermsModel): The parameters to use for the search.
+        session (ArchiveSession): Optional. The session to search with.
+        count (int): Number of results to fetch per page.
+        prefetch (int): Number of pages to fetch ahead while results are processed.
+        partitions (int): If more than 1, split the year range (or without one, the
+                          identifiers) into this many searches that run
+                          concurrently. Results then come in the order they
+                          arrive rather than in a single search's order.
+        index (ShowIndex): Optional. Answer the search from this local index instead
+                           of archive.org.
 
     Returns:
         List[Dict[str, str]]: A list of dictionaries containing search result metadata.
+
+    Raises:
+        PartitionMismatchError: With partitions, if the partitions' totals do not add
+                                up to the search's.
     """
     # Convert the search terms to the proper query format
     query = search_terms.to_query()
@@ -70,12 +118,32 @@ def perform_archive_search(search_terms: SearchTermsModel) -> List[Dict[str, str
               "coverage", "transferer", "avg_rating",
               "num_reviews", "source"]
 
-    # Search the Internet Archive using the internetarchive package
-    results = internetarchive.search_items(query, fields=fields)
+    if index is not None:
+        results = index.search(search_terms)
+        num_found = len(results)
+    else:
+        # Search the Internet Archive, fetching the next page while this one is printed
+        if session is None:
+            session = get_pooled_session()
+        search = ScrapeSearch(session, query, fields=fields, count=count,
+                              prefetch=prefetch)
+        if partitions > 1:
+            # One search per year range, or per identifier prefix when the search
+            # has no year range, all scraped at the same time
+            if search_terms.start_year or search_terms.end_year:
+                searches = [ScrapeSearch(session, model.to_query(), fields=fields,
+                                         count=count, prefetch=0)
+                            for model in search_terms.partition(partitions)]
+            else:
+                searches = search.partition(partitions)
+            results = iter_merged(searches, expected_total=search.num_found)
+        else:
+            results = search
+        num_found = search.num_found
 
     # Collect search results to return
     results_list = []
-    print(f"\nFound {results.num_found} results:\n")
+    print(f"\nFound {num_found} results:\n")
     for item in results:
         # Extract fields with default values if they are missing
         result = {
@@ -0,0 +1,175 @@
+from ia_metadata_cache import MetadataCache
+import internetarchive
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
+from typing import Optional, Dict, Iterable, Iterator, Tuple
+
+
+# requests' own defaults; enough to keep archive.org, s3.us.archive.org and the
+# handful of data nodes a show redirects to alive at the same time.
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+
+def get_pooled_session(config: Optional[dict] = None, config_file: Optional[str] = None,
+                       pool_connections: Optional[int] = None,
+                       pool_maxsize: Optional[int] = None, metadata_cache: bool = False):
+    """
+    Creates an ArchiveSession that keeps its connections alive between requests.
+
+    ArchiveSession sends 'Connection: close' with every request, so each metadata
+    fetch and file download opens a new TCP+TLS connection. This drops that header
+    and mounts connection pools sized from the arguments or, failing that, from
+    the 'pool' section of the ia config (pool_connections / pool_maxsize).
+
+    Args:
+        config (dict): Optional. A config dict passed on to internetarchive.get_session.
+        config_file (str): Optional. Path to an ia config file.
+        pool_connections (int): Optional. Number of per-host pools to keep.
+        pool_maxsize (int): Optional. Maximum number of kept-alive connections per host.
+        metadata_cache (bool): If True, attach a MetadataCache as session.metadata_cache,
+                               configured by the 'metadata_cache' section of the ia
+                               config (path, max_bytes, ttl). get_items_bulk then
+                               reads item metadata through it, and its hit, miss
+                               and revalidation counters are in
+                               session.metadata_cache.stats().
+
+    Returns:
+        ArchiveSession: A session with keep-alive connection pooling enabled.
+    """
+    session = internetarchive.get_session(config=config, config_file=config_file)
+
+    pool_config = session.config.get('pool', {})
+    if pool_connections is None:
+        pool_connections = pool_config.get('pool_connections', DEFAULT_POOL_CONNECTIONS)
+    if pool_maxsize is None:
+        pool_maxsize = pool_config.get('pool_maxsize', DEFAULT_POOL_MAXSIZE)
+    pool_kwargs = {
+        'pool_connections': int(pool_connections),
+        'pool_maxsize': int(pool_maxsize),
+    }
+
+    session.headers.pop('Connection', None)
+
+    # Re-mount the retrying archive.org adapter with the pool sizes.
+    session.http_adapter_kwargs.update(pool_kwargs)
+    session.mount_http_adapter()
+
+    # s3.us.archive.org and the data nodes downloads redirect to (ia8*.us.archive.org)
+    # fall through to the catch-all adapters. S3 keeps its own retry workflow, so
+    # these only get the pool sizes.
+    catch_all_adapter = HTTPAdapter(**pool_kwargs)
+    session.mount('https://', catch_all_adapter)
+    session.mount('http://', catch_all_adapter)
+
+    if metadata_cache:
+        cache_config = session.config.get('metadata_cache', {})
+        converters = {'path': str, 'max_bytes': int, 'ttl': float}
+        cache_kwargs = {key: convert(cache_config[key])
+                        for key, convert in converters.items() if key in cache_config}
+        session.metadata_cache = MetadataCache(
+            session=session, metadata_url=f"{session.protocol}//{session.host}/metadata/",
+            **cache_kwargs)
+    else:
+        session.metadata_cache = None
+
+    return session
+
+
+def pool_stats(session) -> Dict[str, Dict[str, int]]:
+    """
+    Reports connection reuse for every host the session currently holds a pool for.
+
+    Args:
+        session (requests.Session): A session created with get_pooled_session.
+
+    Returns:
+        Dict[str, Dict[str, int]]: Per host, the number of requests sent, new
+        connections opened (pool misses) and requests served on a kept-alive
+        connection (pool hits).
+    """
+    stats = {}
+    adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            host = f"{key.key_host}:{key.key_port}"
+            host_stats = stats.setdefault(host, {'requests': 0, 'misses': 0, 'hits': 0})
+            host_stats['requests'] += pool.num_requests
+            host_stats['misses'] += pool.num_connections
+            host_stats['hits'] += pool.num_requests - pool.num_connections
+    return stats
+
+
+def print_pool_stats(session):
+    """
+    Prints the output of pool_stats, one line per host.
+    """
+    for host, host_stats in sorted(pool_stats(session).items()):
+        print(f"{host}: {host_stats['requests']} requests, "
+              f"{host_stats['misses']} new connections, "
+              f"{host_stats['hits']} reused")
+
+
+def get_items_bulk(session, identifiers: Iterable[str], workers: int = 8,
+                   ordered: bool = False,
+                   request_kwargs: Optional[dict] = None) -> Iterator[Tuple[str, object]]:
+    """
+    Fetches the metadata of many items concurrently.
+
+    Only a few requests per worker are queued at a time, so identifiers can be a
+    long or lazy iterable such as a running search. If the session has a
+    metadata_cache (see get_pooled_session), metadata is read through it.
+
+    Args:
+        session (ArchiveSession): The session to fetch with. For the workers to
+                                  share kept-alive connections, its pool_maxsize
+                                  should be at least workers.
+        identifiers (Iterable[str]): The identifiers of the items to fetch.
+        workers (int): Number of metadata requests to run at the same time.
+        ordered (bool): If True, yield items in the order of identifiers rather
+                        than as they complete.
+        request_kwargs (dict): Optional. Keyword arguments for every request.
+
+    Yields:
+        Tuple[str, object]: The identifier and its Item (or Collection), or the
+        exception raised while fetching it.
+    """
+    cache = getattr(session, 'metadata_cache', None)
+
+    def fetch(identifier):
+        try:
+            item_metadata = None
+            if cache is not None:
+                item_metadata = cache.get_metadata(identifier)
+                if not item_metadata:
+                    # An unknown identifier; get_item would fetch it again.
+                    return identifier, internetarchive.Item(session, identifier,
+                                                            item_metadata)
+            return identifier, session.get_item(identifier, item_metadata=item_metadata,
+                                                request_kwargs=request_kwargs)
+        except Exception as exc:
+            return identifier, exc
+
+    window = workers * 4
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if ordered:
+            pending = deque()
+            for identifier in identifiers:
+                pending.append(executor.submit(fetch, identifier))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        else:
+            pending = set()
+            for identifier in identifiers:
+                pending.add(executor.submit(fetch, identifier))
+                if len(pending) >= window:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            for future in wait(pending).done:
+                yield future.result()
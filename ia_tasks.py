@@ -0,0 +1,108 @@
+from internetarchive.catalog import Catalog, CatalogTask, sort_by_date
+from requests.exceptions import HTTPError
+from typing import Iterable, Iterator, List, Optional
+import json
+
+
+# Read size for the tasks response; rows are a few hundred bytes each.
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class NDJSONDecoder:
+    """
+    Incremental parser for newline-delimited JSON fed as byte chunks.
+
+    Chunks may split rows anywhere, including inside a multi-byte character; only
+    the unfinished tail of a chunk is carried over. Blank lines are skipped.
+    """
+
+    def __init__(self):
+        self._tail = b''
+
+    def feed(self, chunk: bytes) -> List[dict]:
+        """
+        Returns the rows completed by chunk.
+        """
+        if not chunk:
+            return []
+        lines = (self._tail + chunk).split(b'\n') if self._tail else chunk.split(b'\n')
+        self._tail = lines.pop()
+        return [json.loads(line) for line in lines if line.strip()]
+
+    def close(self) -> List[dict]:
+        """
+        Returns the final row if it had no trailing newline.
+        """
+        tail, self._tail = self._tail, b''
+        return [json.loads(tail)] if tail.strip() else []
+
+
+def iter_ndjson(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """
+    Parses newline-delimited JSON from a stream of byte chunks. See NDJSONDecoder.
+    """
+    decoder = NDJSONDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.close()
+
+
+class StreamingCatalog(Catalog):
+    """
+    Catalog whose task listing is streamed.
+
+    Catalog.get_tasks reads the tasks API one byte at a time and builds every row
+    by string concatenation, which makes the history of a busy uploader slow to
+    fetch. Here the response is read in large chunks and parsed row by row.
+    """
+
+    def iter_tasks_stream(self, identifier: str = '', params: Optional[dict] = None,
+                          chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[CatalogTask]:
+        """
+        Yields the tasks meeting all criteria as they are read from the response.
+
+        Takes the same arguments as get_tasks, but never holds more than one chunk
+        of the response and one task in memory. Tasks come in the order the API
+        sends them, not sorted by submission time.
+
+        Args:
+            identifier (str): Optional. Only return tasks for this item.
+            params (dict): Optional. Query parameters for the Tasks API.
+            chunk_size (int): Number of bytes to read from the response at a time.
+
+        Raises:
+            requests.HTTPError: If the Tasks API returns an error.
+        """
+        params = dict(params or {})
+        if identifier:
+            params['identifier'] = identifier
+        params['limit'] = 0
+        if not params.get('summary'):
+            params['summary'] = 0
+
+        r = self.session.get(self.url, params=params, auth=self.auth, stream=True,
+                             **self.request_kwargs)
+        with r:
+            try:
+                r.raise_for_status()
+            except HTTPError:
+                raise HTTPError(r.json()['error'], response=r)
+            for row in iter_ndjson(r.iter_content(chunk_size=chunk_size)):
+                yield CatalogTask(row, self)
+
+    def get_tasks(self, identifier: str = '',
+                  params: Optional[dict] = None) -> List[CatalogTask]:
+        """
+        Returns a list of all tasks meeting all criteria, ordered by submission time
+        (newest first), like Catalog.get_tasks.
+        """
+        return sorted(self.iter_tasks_stream(identifier, params), key=sort_by_date,
+                      reverse=True)
+
+
+def iter_tasks_stream(session, identifier: str = '', params: Optional[dict] = None,
+                      request_kwargs: Optional[dict] = None) -> Iterator[CatalogTask]:
+    """
+    Streams the tasks meeting all criteria. See StreamingCatalog.iter_tasks_stream.
+    """
+    return StreamingCatalog(session, request_kwargs).iter_tasks_stream(identifier, params)
@@ -0,0 +1,309 @@
+from ia_checksum import ChecksumCache, get_md5, iter_directory_files
+from ia_files import file_index
+from ia_governor import DEFAULT_MAX_PUTS_PER_BUCKET, get_governor
+from ia_multipart import DEFAULT_MULTIPART_THRESHOLD, MultipartUpload
+from ia_session import get_pooled_session
+from ia_upload_body import UploadBody
+from concurrent.futures import ThreadPoolExecutor
+from requests.exceptions import HTTPError
+from requests.models import Response
+from functools import partial
+from typing import Callable, List, Optional, Tuple
+import argparse
+import os
+
+
+DEFAULT_RETRIES = 5
+
+
+def upload_file(item, path: str, key: str, retries: int = DEFAULT_RETRIES,
+                checksum: bool = False, verify: bool = False,
+                checksum_cache: Optional[ChecksumCache] = None,
+                part_size: Optional[int] = None,
+                multipart_threshold: int = DEFAULT_MULTIPART_THRESHOLD,
+                part_workers: int = 4,
+                progress: Optional[Callable[[int, int], None]] = None,
+                **upload_kwargs) -> Response:
+    """
+    Uploads one file with Item.upload_file, keeping its retry-on-503 behaviour but
+    pacing attempts with the session's S3Governor (see ia_governor): check_limit
+    answers are shared, overloads back off exponentially for every upload to the
+    item, and the number of concurrent PUTs per item is capped.
+
+    Args:
+        item (Item): The item to upload to.
+        path (str): The local file.
+        key (str): The remote file name.
+        retries (int): Number of times to retry when S3 is overloaded or returns 503.
+        checksum (bool): If True, skip the file if the item already has it with the
+                         same md5.
+        verify (bool): If True, check that S3 received what was sent: with a
+                       Content-MD5 header if the md5 is in checksum_cache, otherwise
+                       by comparing the md5 computed while sending with the ETag.
+        checksum_cache (ChecksumCache): Optional. Where to look up and record md5s.
+        part_size (int): Optional. If given, files of multipart_threshold bytes or
+                         more are sent as an S3 multipart upload in parts of this
+                         size, which resumes where it left off when run again.
+                         Every part is checked against its Content-MD5 whatever
+                         verify says, and the md5 of the whole file is only
+                         recorded in checksum_cache if checksum computed it.
+        multipart_threshold (int): Size from which part_size applies.
+        part_workers (int): Number of parts of a file to upload concurrently.
+        progress (Callable[[int, int], None]): Optional. Called with the bytes sent
+                                               so far and the file size; once per
+                                               part for multipart uploads.
+        **upload_kwargs: Passed on to Item.upload_file (or MultipartUpload).
+
+    Returns:
+        Response: The S3 response, or an empty Response if the file was skipped.
+
+    Raises:
+        ValueError: If verify is set and the ETag S3 returned is not the md5 of the
+                    file as it was sent.
+    """
+    st = os.stat(path)
+    md5 = None
+    if checksum:
+        md5 = get_md5(path, checksum_cache)
+    elif verify and checksum_cache is not None:
+        md5 = checksum_cache.get(path, st)
+    if checksum:
+        remote = file_index(item).get_metadata(key)
+        if not item.tasks and remote and remote.get('md5') == md5:
+            return Response()
+    if part_size and st.st_size >= multipart_threshold:
+        # Every part carries its own Content-MD5, so verify needs nothing more.
+        upload = MultipartUpload(item, path, key, part_size, **upload_kwargs)
+        return upload.upload(part_workers, retries, progress)
+    if verify and md5:
+        # Item.upload_file would hash the file again for verify=True. An md5 that
+        # is not known up front is computed by UploadBody while sending instead.
+        upload_kwargs['headers'] = dict(upload_kwargs.get('headers') or {},
+                                        **{'Content-MD5': md5})
+
+    governor = get_governor(item.session)
+    access_key = upload_kwargs.get('access_key') or item.session.access_key
+    while True:
+        if not governor.wait(item.identifier, access_key, check=retries > 0):
+            print(f" warning: s3 is overloaded, backing off before uploading {key}. "
+                  f"{retries} retries left.")
+            retries -= 1
+            continue
+        try:
+            # Item.upload_file closes the body, so every attempt opens a new one.
+            body = UploadBody(path, progress=progress, compute_md5=verify and not md5)
+            with governor.put_slot(item.identifier):
+                response = item.upload_file(body, key=key, retries=0, **upload_kwargs)
+            governor.record_success(item.identifier)
+            break
+        except HTTPError as exc:
+            response = exc.response
+            if (response is None or response.status_code != 503 or retries <= 0
+                    or b'appears to be spam' in response.content):
+                raise
+            delay = governor.record_overload(item.identifier)
+            print(f" warning: 503 uploading {key}, backing off {delay:.1f} seconds. "
+                  f"{retries} retries left.")
+            retries -= 1
+
+    if verify and not md5 and body.md5:
+        etag = response.headers.get('ETag', '').strip('"')
+        if etag and etag != body.md5:
+            raise ValueError(f"{key}: S3 returned ETag {etag}, but the md5 of what was "
+                             f"sent is {body.md5}")
+        if checksum_cache is not None and os.stat(path).st_mtime_ns == st.st_mtime_ns:
+            checksum_cache.put(path, st, body.md5)
+    return response
+
+
+def upload_files(item, files: List[Tuple[str, str]], workers: int = 1,
+                 metadata: Optional[dict] = None, queue_derive: bool = True,
+                 retries: int = DEFAULT_RETRIES, checksum: bool = False,
+                 verify: bool = False,
+                 ignore_errors: bool = False,
+                 access_key: Optional[str] = None, secret_key: Optional[str] = None,
+                 part_size: Optional[int] = None,
+                 multipart_threshold: int = DEFAULT_MULTIPART_THRESHOLD,
+                 progress: Optional[Callable[[str, int, int], None]] = None
+                 ) -> List[object]:
+    """
+    Uploads files to an item, several at a time.
+
+    If the item does not exist yet, the first file is uploaded on its own so it
+    creates the item with metadata. If queue_derive is set, the last file is
+    uploaded on its own after all others, so the derive it queues sees every file,
+    as with Item.upload. Progress is reported per file in the order of files.
+
+    Args:
+        item (Item): The item to upload to.
+        files (List[Tuple[str, str]]): (remote name, local path) of every file.
+        workers (int): Number of files to upload concurrently. For the workers to
+                       share kept-alive connections, the item's session should have
+                       a pool_maxsize of at least workers (see get_pooled_session).
+                       PUTs are also capped by the session's S3Governor, which
+                       allows max_puts_per_bucket at a time.
+        metadata (dict): Optional. Item metadata, used if the item is created.
+        queue_derive (bool): If True, queue a derive with the last file.
+        retries (int): Number of times to retry a file when S3 is overloaded.
+        checksum (bool): If True, skip files the item already has with the same md5.
+        verify (bool): If True, have S3 check the md5 of every file it receives.
+        ignore_errors (bool): If True, failed files are reported and their
+                              exceptions returned instead of raising the first error.
+        access_key (str): Optional. IA-S3 access key, defaults to the session's.
+        secret_key (str): Optional. IA-S3 secret key, defaults to the session's.
+        part_size (int): Optional. Upload files of multipart_threshold bytes or more
+                         in parts of this size; see upload_file.
+        multipart_threshold (int): Size from which part_size applies.
+        progress (Callable[[str, int, int], None]): Optional. Called with the remote
+                                                    name, bytes sent so far and size
+                                                    of a file as it is uploaded.
+
+    Returns:
+        List[object]: The Response of every file in the order of files, or with
+        ignore_errors, the exception raised for it.
+    """
+    checksum_cache = ChecksumCache() if checksum or verify else None
+    total_size = sum(os.path.getsize(path) for _, path in files)
+    headers = {'x-archive-size-hint': str(total_size)}
+
+    def send(i):
+        key, path = files[i]
+        file_progress = partial(progress, key) if progress is not None else None
+        return upload_file(item, path, key, retries=retries, checksum=checksum,
+                           verify=verify, checksum_cache=checksum_cache,
+                           part_size=part_size, multipart_threshold=multipart_threshold,
+                           progress=file_progress, metadata=metadata,
+                           headers=headers, access_key=access_key, secret_key=secret_key,
+                           queue_derive=queue_derive and i == len(files) - 1)
+
+    results = [None] * len(files)
+
+    def report(i, result):
+        results[i] = result
+        key = files[i][0]
+        if isinstance(result, Exception):
+            print(f"[{i + 1}/{len(files)}] {key}: failed ({result})")
+        elif result.status_code is None:
+            print(f"[{i + 1}/{len(files)}] {key}: already uploaded")
+        else:
+            print(f"[{i + 1}/{len(files)}] {key}: done")
+
+    def run_alone(i):
+        try:
+            report(i, send(i))
+        except Exception as exc:
+            if not ignore_errors:
+                raise
+            report(i, exc)
+
+    try:
+        first = 0
+        last = len(files)
+        if files and not item.exists:
+            run_alone(0)
+            first = 1
+        if queue_derive and last > first:
+            last -= 1
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(send, i) for i in range(first, last)]
+            for i, future in zip(range(first, last), futures):
+                try:
+                    report(i, future.result())
+                except Exception as exc:
+                    if not ignore_errors:
+                        for pending in futures:
+                            pending.cancel()
+                        raise
+                    report(i, exc)
+
+        if last < len(files):
+            run_alone(last)
+    finally:
+        if checksum_cache is not None:
+            checksum_cache.close()
+
+    governor = get_governor(item.session)
+    print(f"{governor.checks} check_limit requests ({governor.cached_checks} answered "
+          f"from cache), {governor.overloads} overloads, "
+          f"{governor.backoff_seconds:.1f} s backing off, "
+          f"{governor.slot_wait_seconds:.1f} s waiting for a PUT slot")
+    return results
+
+
+def upload_directory(item, directory: str, remote_dir: Optional[str] = None,
+                     **kwargs) -> List[object]:
+    """
+    Uploads every file below directory, keeping its layout. See upload_files for
+    the keyword arguments.
+
+    Args:
+        item (Item): The item to upload to.
+        directory (str): The local directory.
+        remote_dir (str): Optional. Directory in the item to upload into.
+
+    Returns:
+        List[object]: The Response (or exception) of every file, in path order.
+    """
+    files = []
+    for path in iter_directory_files(directory):
+        key = os.path.relpath(path, directory).replace(os.sep, '/')
+        if remote_dir:
+            key = f"{remote_dir.strip('/')}/{key}"
+        files.append((key, path))
+    return upload_files(item, files, **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Upload files or a directory to an item.")
+    parser.add_argument('identifier')
+    parser.add_argument('paths', nargs='+', help="Files or directories to upload.")
+    parser.add_argument('--remote-dir', help="Directory in the item to upload into.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of files to upload concurrently.")
+    parser.add_argument('--metadata', action='append', default=[], metavar='KEY:VALUE',
+                        help="Item metadata, used if the item is created.")
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES)
+    parser.add_argument('--max-puts', type=int,
+                        help="Maximum number of PUTs to the item at a time "
+                             "(default: --workers, at least "
+                             f"{DEFAULT_MAX_PUTS_PER_BUCKET}).")
+    parser.add_argument('--checksum', action='store_true',
+                        help="Skip files the item already has with the same md5.")
+    parser.add_argument('--verify', action='store_true',
+                        help="Have S3 check the md5 of every file it receives.")
+    parser.add_argument('--part-size', type=int, metavar='MIB',
+                        help="Upload large files as resumable multipart uploads in "
+                             "parts of this many MiB.")
+    parser.add_argument('--multipart-threshold', type=int, metavar='MIB',
+                        default=DEFAULT_MULTIPART_THRESHOLD // (1024 * 1024),
+                        help="Size in MiB from which --part-size applies.")
+    parser.add_argument('--no-derive', action='store_true')
+    parser.add_argument('--ignore-errors', action='store_true',
+                        help="Keep going when a file fails to upload.")
+    args = parser.parse_args()
+
+    session = get_pooled_session(pool_maxsize=max(args.workers, 10))
+    get_governor(session, max_puts_per_bucket=args.max_puts or max(
+        args.workers, DEFAULT_MAX_PUTS_PER_BUCKET))
+    upload_item = session.get_item(args.identifier)
+    upload_metadata = dict(m.split(':', 1) for m in args.metadata)
+
+    upload_list = []
+    for local_path in args.paths:
+        if os.path.isdir(local_path):
+            for file_path in iter_directory_files(local_path):
+                remote_key = os.path.relpath(file_path, local_path).replace(os.sep, '/')
+                upload_list.append((remote_key, file_path))
+        else:
+            upload_list.append((os.path.basename(local_path), local_path))
+    if args.remote_dir:
+        upload_list = [(f"{args.remote_dir.strip('/')}/{k}", p) for k, p in upload_list]
+
+    upload_files(upload_item, upload_list, workers=args.workers, metadata=upload_metadata,
+                 queue_derive=not args.no_derive, retries=args.retries,
+                 checksum=args.checksum, verify=args.verify,
+                 ignore_errors=args.ignore_errors,
+                 part_size=args.part_size * 1024 * 1024 if args.part_size else None,
+                 multipart_threshold=args.multipart_threshold * 1024 * 1024)
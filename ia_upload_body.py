@@ -0,0 +1,130 @@
+from typing import Callable, Optional
+import hashlib
+import os
+
+
+# Read size for the upload body; requests asks for far smaller blocks and is
+# served slices of this buffer.
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+
+class UploadBody:
+    """
+    File-like upload body that reads into one reused buffer.
+
+    Item.upload_file either hands requests the open file, which is read in the
+    connection's small blocks, or, when verbose, wraps it in
+    IterableToFileAdapter(tqdm(chunk_generator(...))), whose read ignores its size
+    argument and allocates a new bytes object per MiB. UploadBody fills a single
+    buffer with readinto and answers read(size) with memoryview slices of it, so
+    nothing is copied or allocated per block. Progress is reported through a
+    callback, and the md5 of the file is computed as it is read.
+
+    A slice returned by read is only valid until the next read, which is how
+    http.client and urllib3 use it: every block is sent before the next is read.
+    """
+
+    def __init__(self, path: str, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 progress: Optional[Callable[[int, int], None]] = None,
+                 compute_md5: bool = True):
+        """
+        Args:
+            path (str): The file to upload.
+            buffer_size (int): Size of the read buffer.
+            progress (Callable[[int, int], None]): Optional. Called with the bytes
+                                                   read so far and the file size
+                                                   after every read.
+            compute_md5 (bool): If True, hash the file as it is read; see md5.
+        """
+        self.name = path
+        self.mode = 'rb'
+        self._file = open(path, 'rb', buffering=0)
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._buffer = memoryview(bytearray(buffer_size))
+        self._start = 0
+        self._end = 0
+        self._position = 0
+        self.progress = progress
+        self.compute_md5 = compute_md5
+        self._md5 = hashlib.md5() if compute_md5 else None
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self._position = self._file.seek(offset)
+        self._start = self._end = 0
+        # A hash is only meaningful when the file is read from its start.
+        self._md5 = hashlib.md5() if self.compute_md5 and self._position == 0 else None
+        return self._position
+
+    def _fill(self) -> int:
+        n = self._file.readinto(self._buffer)
+        self._start = 0
+        self._end = n
+        if self._md5 is not None and n:
+            self._md5.update(self._buffer[:n])
+        return n
+
+    def read(self, size: int = -1):
+        """
+        Returns up to size bytes as a memoryview into the buffer, or all remaining
+        bytes as bytes if size is negative. An empty result means end of file.
+        """
+        if size is None or size < 0:
+            chunks = []
+            while True:
+                chunk = self.read(len(self._buffer))
+                if not chunk:
+                    return b''.join(chunks)
+                chunks.append(bytes(chunk))
+        if self._start == self._end and not self._fill():
+            return b''
+        chunk = self._buffer[self._start:min(self._end, self._start + size)]
+        self._start += len(chunk)
+        self._position += len(chunk)
+        if self.progress is not None:
+            self.progress(self._position, self.size)
+        return chunk
+
+    def readinto(self, b) -> int:
+        chunk = self.read(len(b))
+        n = len(chunk)
+        memoryview(b).cast('B')[:n] = chunk
+        return n
+
+    @property
+    def md5(self) -> Optional[str]:
+        """
+        The hex md5 of the file, once it has been read to the end from its start;
+        None before that or if compute_md5 is False.
+        """
+        if self._md5 is None or self._position < self.size:
+            return None
+        return self._md5.hexdigest()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,377 @@
+from audio_silence import frame_at, merge_silent_starts, millisecond_energy, \
+    nonsilent_from_silent, segment_length, silent_windows
+from pydub import AudioSegment
+from pydub.exceptions import CouldntDecodeError
+from pydub.utils import db_to_float, get_prober_name
+from typing import Iterator, List, Optional
+import json
+import subprocess
+
+import numpy as np
+
+
+# Length of the blocks PCM is read in; 10 s of 44.1 kHz stereo is about 1.7 MB.
+DEFAULT_BLOCK_MS = 10 * 1000
+
+SAMPLE_WIDTH = 2
+MAX_POSSIBLE_AMPLITUDE = 2 ** (SAMPLE_WIDTH * 8) / 2
+
+
+def probe_audio(path: str) -> dict:
+    """
+    Returns the frame rate, channel count and duration (in ms) of the first audio
+    stream of a file, as ffprobe reports them.
+    """
+    command = [get_prober_name(), '-v', 'error', '-select_streams', 'a:0',
+               '-show_entries', 'stream=sample_rate,channels:format=duration',
+               '-of', 'json', path]
+    p = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if p.returncode != 0:
+        raise CouldntDecodeError(f"ffprobe failed on {path}: "
+                                 f"{p.stderr.decode(errors='ignore')}")
+    info = json.loads(p.stdout)
+    if not info.get('streams'):
+        raise CouldntDecodeError(f"no audio stream in {path}")
+    stream = info['streams'][0]
+    duration = info.get('format', {}).get('duration')
+    return {'frame_rate': int(stream['sample_rate']), 'channels': int(stream['channels']),
+            'duration_ms': round(float(duration) * 1000) if duration else None}
+
+
+def iter_pcm_blocks(path: str, block_ms: int = DEFAULT_BLOCK_MS,
+                    frame_rate: Optional[int] = None, channels: Optional[int] = None,
+                    start_ms: int = 0, duration_ms: Optional[int] = None
+                    ) -> Iterator[np.ndarray]:
+    """
+    Decodes a file with ffmpeg and yields its samples as 16-bit PCM in blocks of
+    block_ms, without ever holding more than one block in memory.
+
+    Every block is an int16 array of shape (frames, channels) and a view of one
+    reused buffer: it is only valid until the next block is read, so copy what has
+    to be kept. Only the last block is shorter than block_ms.
+
+    Args:
+        path (str): The audio file.
+        block_ms (int): Length of a block in milliseconds.
+        frame_rate (int): Optional. Resample to this rate; defaults to the file's.
+        channels (int): Optional. Mix to this many channels; defaults to the file's.
+        start_ms (int): Optional. Start decoding this far into the file.
+        duration_ms (int): Optional. Stop after this much audio.
+
+    Raises:
+        CouldntDecodeError: If ffmpeg fails.
+    """
+    if frame_rate is None or channels is None:
+        info = probe_audio(path)
+        frame_rate = frame_rate or info['frame_rate']
+        channels = channels or info['channels']
+
+    command = [AudioSegment.converter, '-nostdin', '-v', 'error']
+    if start_ms:
+        command += ['-ss', f'{start_ms / 1000:.3f}']
+    command += ['-i', path, '-vn']
+    if duration_ms is not None:
+        command += ['-t', f'{duration_ms / 1000:.3f}']
+    command += ['-f', 's16le', '-acodec', 'pcm_s16le', '-ar', str(frame_rate),
+                '-ac', str(channels), '-']
+
+    block = np.empty((max(1, frame_at(block_ms, frame_rate)), channels), dtype=np.int16)
+    view = memoryview(block).cast('B')
+    frame_width = channels * SAMPLE_WIDTH
+    p = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         bufsize=0)
+    finished = False
+    try:
+        while True:
+            # A pipe hands out what it has; keep reading until the block is full.
+            filled = 0
+            while filled < len(view):
+                n = p.stdout.readinto(view[filled:])
+                if not n:
+                    break
+                filled += n
+            frames = filled // frame_width
+            if frames:
+                yield block[:frames]
+            if filled < len(view):
+                break
+        finished = True
+    finally:
+        if not finished and p.poll() is None:
+            # The caller stopped early.
+            p.kill()
+        p.stdout.close()
+        stderr = p.stderr.read()
+        p.stderr.close()
+        p.wait()
+    if p.returncode != 0:
+        raise CouldntDecodeError(f"Decoding failed. ffmpeg returned error code: "
+                                 f"{p.returncode}\n\n{stderr.decode(errors='ignore')}")
+
+
+def decode_to_file(path: str, pcm_path: str, frame_rate: int, channels: int,
+                   block_ms: int = DEFAULT_BLOCK_MS) -> int:
+    """
+    Decodes a file to raw interleaved 16-bit PCM at pcm_path (.s16le), block by
+    block, for processes to memory-map.
+
+    Returns:
+        int: The number of frames written.
+    """
+    frames = 0
+    with open(pcm_path, 'wb') as f:
+        for block in iter_pcm_blocks(path, block_ms, frame_rate, channels):
+            f.write(block)
+            frames += len(block)
+    return frames
+
+
+def decode_segment(path: str, start_ms: int, end_ms: int, frame_rate: int,
+                   channels: int) -> AudioSegment:
+    """
+    Decodes only [start_ms, end_ms) of a file into an AudioSegment, seeking rather
+    than decoding the whole file. Has as many frames as audio[start_ms:end_ms].
+    """
+    frame_width = channels * SAMPLE_WIDTH
+    size = (frame_at(end_ms, frame_rate) - frame_at(start_ms, frame_rate)) * frame_width
+    data = bytearray()
+    for block in iter_pcm_blocks(path, frame_rate=frame_rate, channels=channels,
+                                 start_ms=start_ms, duration_ms=end_ms - start_ms):
+        data += memoryview(block).cast('B')[:size - len(data)]
+    return AudioSegment(data=bytes(data), sample_width=SAMPLE_WIDTH,
+                        frame_rate=frame_rate, channels=channels)
+
+
+def to_mono_float(block: np.ndarray) -> np.ndarray:
+    """
+    Converts an int16 (frames, channels) block to mono float32 in [-1, 1), as
+    librosa.load(mono=True) does.
+    """
+    return block.mean(axis=1, dtype=np.float32) / np.float32(32768)
+
+
+class StreamingSilenceDetector:
+    """
+    pydub.silence.detect_silence / detect_nonsilent over PCM fed block by block.
+
+    pydub slices the whole AudioSegment once per seek_step and takes the RMS of
+    every min_silence_len window. Here the squared samples of every millisecond are
+    summed as they arrive, and a window's RMS is computed from the sums of its
+    milliseconds, so only the last min_silence_len milliseconds and the open
+    silent range are carried from one block to the next. Windows, thresholds and
+    range merging follow pydub exactly, so the ranges are the same as pydub's on
+    the whole decoded file.
+
+    Usage::
+
+        detector = StreamingSilenceDetector(44100, 2, 1000, -40)
+        for block in iter_pcm_blocks(path):
+            detector.feed(block)
+        detector.close()
+        detector.nonsilent_ranges
+    """
+
+    def __init__(self, frame_rate: int, channels: int, min_silence_len: int = 1000,
+                 silence_thresh: float = -16, seek_step: int = 1):
+        """
+        Args:
+            frame_rate (int): Frames per second of the PCM.
+            channels (int): Number of interleaved channels.
+            min_silence_len (int): The minimum length of a silence, in ms.
+            silence_thresh (float): The upper bound for how quiet is silent, in dBFS.
+            seek_step (int): Step between windows, in ms.
+        """
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.min_silence_len = min_silence_len
+        self.seek_step = seek_step
+        self.thresh = db_to_float(silence_thresh) * MAX_POSSIBLE_AMPLITUDE
+
+        self.frames = 0
+        self.silent_ranges: List[List[int]] = []
+        self.nonsilent_ranges: Optional[List[List[int]]] = None
+        self.closed = False
+
+        # Samples of the frames after the last complete millisecond.
+        self._tail = np.zeros(0, dtype=np.int16)
+        # Number of complete milliseconds, and the energies of those from _base on.
+        self._ms = 0
+        self._base = 0
+        self._energy = np.zeros(0, dtype=np.int64)
+        # Next window start to test.
+        self._next = 0
+        # The open silent range: its start and the last silent window in it.
+        self._run_start = None
+        self._prev = None
+
+    def __len__(self) -> int:
+        # The length pydub gives the audio fed so far, in ms.
+        return segment_length(self.frames, self.frame_rate)
+
+    def feed(self, block: np.ndarray) -> List[List[int]]:
+        """
+        Adds a block of int16 samples, shaped (frames, channels) or interleaved.
+
+        Returns:
+            List[List[int]]: The silent ranges completed by the block.
+        """
+        block = np.asarray(block, dtype=np.int16).reshape(-1)
+        self.frames += len(block) // self.channels
+        self._add_energy(np.concatenate((self._tail, block)), final=False)
+        done = len(self.silent_ranges)
+        # Hold back the last millisecond: pydub's length of the audio, and so its
+        # last window, is only known at the end.
+        self._scan(self._grid(self._ms - self.min_silence_len - 1))
+        # Keep the energies from the next window on, and from the earliest start
+        # pydub's off-grid last window can have.
+        first_needed = self._next - self.seek_step + 1
+        keep = max(0, min(first_needed - self._base, len(self._energy)))
+        self._energy = self._energy[keep:]
+        self._base += keep
+        return self.silent_ranges[done:]
+
+    def close(self) -> List[List[int]]:
+        """
+        Ends the stream and computes nonsilent_ranges.
+
+        Returns:
+            List[List[int]]: The silent ranges completed since the last feed.
+        """
+        done = len(self.silent_ranges)
+        seg_len = len(self)
+        last_slice_start = seg_len - self.min_silence_len
+        if last_slice_start >= 0:
+            if seg_len > self._ms:
+                # pydub pads a window running past the last frame with silence.
+                self._add_energy(self._tail, final=True, end_ms=seg_len)
+            starts = self._grid(last_slice_start)
+            # pydub always tests the last window, even off the seek_step grid.
+            if last_slice_start % self.seek_step:
+                starts = np.append(starts, last_slice_start)
+            self._scan(starts)
+        if self._prev is not None:
+            self.silent_ranges.append([int(self._run_start),
+                                       int(self._prev) + self.min_silence_len])
+        self._tail = np.zeros(0, dtype=np.int16)
+        self._energy = np.zeros(0, dtype=np.int64)
+        self.closed = True
+        self.nonsilent_ranges = nonsilent_from_silent(self.silent_ranges, seg_len)
+        return self.silent_ranges[done:]
+
+    def _add_energy(self, samples, final, end_ms=None):
+        # Adds the energies of the milliseconds from _ms on, given their samples, up
+        # to the last complete one or, if final, up to end_ms.
+        if final:
+            end = end_ms
+        else:
+            # The number of milliseconds that start at or before the last frame fed.
+            end = ((self.frames + 1) * 1000 - 1) // self.frame_rate
+        if end <= self._ms:
+            self._tail = samples
+            return
+        ms_energy, used = millisecond_energy(samples, self.frame_rate, self.channels,
+                                             self._ms, end)
+        self._tail = samples[used * self.channels:]
+        self._energy = np.concatenate((self._energy, ms_energy))
+        self._ms = end
+
+    def _grid(self, last_start):
+        # The window starts from _next to last_start on the seek_step grid.
+        if last_start < self._next:
+            return np.zeros(0, dtype=np.int64)
+        starts = np.arange(self._next, last_start + 1, self.seek_step, dtype=np.int64)
+        self._next = int(starts[-1]) + self.seek_step
+        return starts
+
+    def _scan(self, starts):
+        # Tests the windows at starts and merges the silent ones into ranges.
+        if not len(starts):
+            return
+        silent = starts[silent_windows(self._energy, starts, self._base,
+                                       self.min_silence_len, self.frame_rate,
+                                       self.channels, self.thresh)]
+        if not len(silent):
+            return
+        if self._prev is None:
+            self._run_start = self._prev = int(silent[0])
+            silent = silent[1:]
+        ranges, self._run_start, self._prev = merge_silent_starts(
+            silent, self._run_start, self._prev, self.min_silence_len, self.seek_step)
+        self.silent_ranges.extend(ranges)
+
+
+class StreamingOnsetEnvelope:
+    """
+    librosa.onset.onset_strength over mono samples fed block by block.
+
+    Computes the same mel spectral flux as onset_strength with its defaults (a
+    centred, zero-padded STFT, 128 mel bands, lag 1) frame by frame, carrying the
+    last n_fft - hop_length samples and the last spectrum from one block to the
+    next. The only difference is that onset_strength floors the spectrum at 80 dB
+    below its loudest frame, which needs the whole signal; here it is only floored
+    at -100 dB, which changes values in near silence.
+    """
+
+    def __init__(self, sr: int, hop_length: int = 512, n_fft: int = 2048,
+                 n_mels: int = 128):
+        import librosa
+
+        self.sr = sr
+        self.hop_length = hop_length
+        self.n_fft = n_fft
+        window = librosa.filters.get_window('hann', n_fft, fftbins=True)
+        self.window = window.astype(np.float32)
+        self.mel_basis = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels)
+        self.samples = 0
+        self.emitted = 0
+        # Centring pads the signal with n_fft // 2 zeros on both sides.
+        self._buffer = np.zeros(n_fft // 2, dtype=np.float32)
+        self._last = None
+        # onset_strength shifts the flux by lag + n_fft // (2 * hop_length) frames
+        # and cuts it to the number of STFT frames, so the last few values wait
+        # for close.
+        self._pending = np.zeros(1 + n_fft // (2 * hop_length), dtype=np.float32)
+        self._held = n_fft // (2 * hop_length)
+
+    def feed(self, y: np.ndarray) -> np.ndarray:
+        """
+        Adds mono float samples.
+
+        Returns:
+            np.ndarray: The envelope values completed so far.
+        """
+        self.samples += len(y)
+        self._buffer = np.concatenate((self._buffer, y.astype(np.float32, copy=False)))
+        self._analyse()
+        ready = self._pending[:max(0, len(self._pending) - self._held)]
+        self._pending = self._pending[len(ready):]
+        self.emitted += len(ready)
+        return ready
+
+    def close(self) -> np.ndarray:
+        """
+        Returns the rest of the envelope.
+        """
+        self._buffer = np.concatenate((self._buffer,
+                                       np.zeros(self.n_fft // 2, dtype=np.float32)))
+        self._analyse()
+        total = 1 + self.samples // self.hop_length
+        rest = self._pending[:max(0, total - self.emitted)]
+        self._pending = np.zeros(0, dtype=np.float32)
+        self.emitted += len(rest)
+        return rest
+
+    def _analyse(self):
+        if len(self._buffer) < self.n_fft:
+            return
+        count = 1 + (len(self._buffer) - self.n_fft) // self.hop_length
+        frames = np.lib.stride_tricks.sliding_window_view(
+            self._buffer, self.n_fft)[::self.hop_length][:count]
+        power = np.abs(np.fft.rfft(frames * self.window, axis=1)) ** 2
+        mel_db = 10 * np.log10(np.maximum(1e-10, self.mel_basis @ power.T))
+        if self._last is not None:
+            mel_db = np.concatenate((self._last, mel_db), axis=1)
+        flux = np.maximum(0, np.diff(mel_db, axis=1)).mean(axis=0).astype(np.float32)
+        self._pending = np.concatenate((self._pending, flux))
+        self._last = mel_db[:, -1:]
+        self._buffer = self._buffer[count * self.hop_length:]
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from pydub import AudioSegment
+from pydub import silence as pydub_silence
+
+from audio_silence import detect_nonsilent, detect_silence
+
+
+def make_segment(frame_rate, channels, sample_width=2, seconds=5):
+    """
+    Noise whose loudness changes every 20 ms to 1 s, from near silence to loud.
+    """
+    rng = np.random.default_rng(frame_rate)
+    # An odd number of frames, so the last millisecond is a partial one.
+    frames = seconds * frame_rate + 7
+    amplitude = np.empty(frames)
+    pos = 0
+    while pos < frames:
+        length = int(rng.integers(frame_rate // 50, frame_rate))
+        amplitude[pos:pos + length] = rng.choice([3, 30, 300, 3000, 20000])
+        pos += length
+    samples = rng.standard_normal((frames, channels)) * amplitude[:, None]
+    if sample_width == 1:
+        samples = (samples / 256).clip(-128, 127).astype(np.int8)
+    else:
+        samples = samples.clip(-32768, 32767).astype(np.int16)
+    return AudioSegment(data=samples.tobytes(), sample_width=sample_width,
+                        frame_rate=frame_rate, channels=channels)
+
+
+@pytest.mark.parametrize('frame_rate,channels,sample_width', [
+    (44100, 2, 2),
+    (22050, 1, 2),
+    (8000, 1, 1),
+    (11025, 2, 2),
+])
+@pytest.mark.parametrize('min_silence_len,silence_thresh,seek_step', [
+    (1000, -40, 1),
+    (100, -30, 1),
+    (333, -50, 10),
+])
+def test_detect_nonsilent_matches_pydub(frame_rate, channels, sample_width,
+                                        min_silence_len, silence_thresh, seek_step):
+    segment = make_segment(frame_rate, channels, sample_width)
+    args = (min_silence_len, silence_thresh, seek_step)
+    assert detect_silence(segment, *args) == pydub_silence.detect_silence(segment, *args)
+    assert detect_nonsilent(segment, *args) == \
+        pydub_silence.detect_nonsilent(segment, *args)
+
+
+def test_detect_nonsilent_edge_cases():
+    silent = AudioSegment.silent(duration=1500, frame_rate=44100)
+    assert detect_nonsilent(silent) == pydub_silence.detect_nonsilent(silent) == []
+    assert detect_silence(silent) == pydub_silence.detect_silence(silent)
+
+    # Shorter than min_silence_len.
+    short = make_segment(44100, 1)[:700]
+    assert detect_nonsilent(short) == pydub_silence.detect_nonsilent(short)
+    assert detect_nonsilent(AudioSegment.empty()) == \
+        pydub_silence.detect_nonsilent(AudioSegment.empty())
@@ -0,0 +1,70 @@
+import hashlib
+import os
+
+import ia_checksum
+from ia_checksum import ChecksumCache, get_md5, hash_files
+
+
+def write(path, data):
+    with open(path, 'wb') as fh:
+        fh.write(data)
+    return str(path)
+
+
+def test_checksum_cache_get_put(tmpdir):
+    path = write(tmpdir.join('a.txt'), b'test content')
+    with ChecksumCache(str(tmpdir.join('cache.sqlite'))) as cache:
+        st = os.stat(path)
+        assert cache.get(path, st) is None
+        cache.put(path, st, 'abc')
+        assert cache.get(path, st) == 'abc'
+        assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_checksum_cache_persists(tmpdir):
+    path = write(tmpdir.join('a.txt'), b'test content')
+    cache_path = str(tmpdir.join('cache.sqlite'))
+    with ChecksumCache(cache_path) as cache:
+        cache.put(path, os.stat(path), 'abc')
+    with ChecksumCache(cache_path) as cache:
+        assert cache.get(path, os.stat(path)) == 'abc'
+
+
+def test_checksum_cache_invalidated_by_changes(tmpdir):
+    path = write(tmpdir.join('a.txt'), b'test content')
+    with ChecksumCache(str(tmpdir.join('cache.sqlite'))) as cache:
+        cache.put(path, os.stat(path), 'abc')
+
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+        assert cache.get(path, os.stat(path)) is None
+
+        cache.put(path, os.stat(path), 'abc')
+        write(path, b'other content')
+        assert cache.get(path, os.stat(path)) is None
+
+
+def test_get_md5_uses_cache(tmpdir, monkeypatch):
+    path = write(tmpdir.join('a.txt'), b'test content')
+    calls = []
+
+    def hash_path(p):
+        calls.append(p)
+        return hashlib.md5(open(p, 'rb').read()).hexdigest()
+    monkeypatch.setattr(ia_checksum, '_hash_path', hash_path)
+
+    expected = hashlib.md5(b'test content').hexdigest()
+    with ChecksumCache(str(tmpdir.join('cache.sqlite'))) as cache:
+        assert get_md5(path, cache) == expected
+        assert get_md5(path, cache) == expected
+    assert calls == [path]
+
+
+def test_hash_files(tmpdir):
+    contents = [b'', b'test content', b'x' * (ia_checksum.READ_SIZE + 1)]
+    paths = [write(tmpdir.join('{0}.bin'.format(i)), data)
+             for i, data in enumerate(contents)]
+    with ChecksumCache(str(tmpdir.join('cache.sqlite'))) as cache:
+        md5s = hash_files(reversed(paths), workers=2, cache=cache)
+    assert list(md5s) == paths[::-1]
+    assert [md5s[p] for p in paths] == [hashlib.md5(d).hexdigest() for d in contents]
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+
+from tests.conftest import IaRequestsMock, PROTOCOL
+
+import responses
+from internetarchive import Item
+
+from ia_file_download import JOURNAL_SUFFIX, PART_SUFFIX, download_file
+
+
+DATA = bytes(range(256)) * 40
+MTIME = 1500000000
+URL = '{0}//archive.org/download/test_item/show.flac'.format(PROTOCOL)
+EXPECTED = {'size': len(DATA), 'md5': hashlib.md5(DATA).hexdigest(), 'mtime': MTIME}
+
+
+def get_file(session):
+    item = Item(session, 'test_item', {
+        'metadata': {'identifier': 'test_item'},
+        'files': [{'name': 'show.flac', 'source': 'original', 'size': str(len(DATA)),
+                   'md5': EXPECTED['md5'], 'mtime': str(MTIME)}],
+    })
+    return item.get_file('show.flac')
+
+
+def write_partial(path, data, bytes_received, expected=EXPECTED):
+    with open(path + PART_SUFFIX, 'wb') as fh:
+        fh.write(data)
+    with open(path + JOURNAL_SUFFIX, 'w') as fh:
+        json.dump({'expected': expected, 'bytes_received': bytes_received}, fh)
+
+
+def range_callback(ranges):
+    def callback(request):
+        ranges.append(request.headers.get('Range'))
+        if not request.headers.get('Range'):
+            return (200, {}, DATA)
+        start = int(request.headers['Range'][len('bytes='):-1])
+        if start >= len(DATA):
+            return (416, {'Content-Range': 'bytes */{0}'.format(len(DATA))}, b'')
+        return (206, {}, DATA[start:])
+    return callback
+
+
+def download(session, path, ranges):
+    with IaRequestsMock() as rsps:
+        rsps.add_callback(responses.GET, URL, callback=range_callback(ranges))
+        return download_file(session, get_file(session), path, checksum=True)
+
+
+def assert_downloaded(path):
+    with open(path, 'rb') as fh:
+        assert fh.read() == DATA
+    assert int(os.stat(path).st_mtime) == MTIME
+    assert not os.path.exists(path + PART_SUFFIX)
+    assert not os.path.exists(path + JOURNAL_SUFFIX)
+
+
+def test_download_file_resumes_from_journal(tmpdir, session):
+    path = str(tmpdir.join('show.flac'))
+    # Bytes past the journaled offset may not have been written completely.
+    write_partial(path, DATA[:3000] + b'\0' * 500, bytes_received=3000)
+    ranges = []
+
+    assert download(session, path, ranges) is True
+    assert ranges == ['bytes=3000-']
+    assert_downloaded(path)
+
+
+def test_download_file_resume_checks_md5_of_kept_bytes(tmpdir, session):
+    path = str(tmpdir.join('show.flac'))
+    write_partial(path, b'x' * 3000, bytes_received=3000)
+    ranges = []
+
+    # The corrupt prefix fails the md5, so the file is fetched again in full.
+    assert download(session, path, ranges) is True
+    assert ranges == ['bytes=3000-', None]
+    assert_downloaded(path)
+
+
+def test_download_file_ignores_stale_journal(tmpdir, session):
+    path = str(tmpdir.join('show.flac'))
+    write_partial(path, DATA[:3000], bytes_received=3000,
+                  expected=dict(EXPECTED, md5='0' * 32))
+    ranges = []
+
+    assert download(session, path, ranges) is True
+    assert ranges == [None]
+    assert_downloaded(path)
+
+
+def test_download_file_416_when_complete(tmpdir, session):
+    path = str(tmpdir.join('show.flac'))
+    write_partial(path, DATA, bytes_received=len(DATA))
+    ranges = []
+
+    assert download(session, path, ranges) is True
+    assert ranges == ['bytes={0}-'.format(len(DATA))]
+    assert_downloaded(path)
+
+
+def test_download_file_416_when_part_is_longer(tmpdir, session):
+    path = str(tmpdir.join('show.flac'))
+    write_partial(path, DATA + b'x' * 10, bytes_received=len(DATA) + 10)
+    ranges = []
+
+    assert download(session, path, ranges) is True
+    assert ranges == ['bytes={0}-'.format(len(DATA) + 10), None]
+    assert_downloaded(path)
@@ -0,0 +1,113 @@
+import json
+from urllib.parse import parse_qs, urlsplit
+
+from tests.conftest import BASE_URL, IaRequestsMock
+
+import responses
+
+from ia_index import ShowIndex
+from ia_search import SearchTermsModel
+
+
+SCRAPE_URL = BASE_URL + 'services/search/v1/scrape'
+
+SHOWS = [
+    {'identifier': 'gd1977-05-08', 'title': 'Grateful Dead Live at Barton Hall',
+     'date': '1977-05-08T00:00:00Z', 'venue': 'Barton Hall, Cornell University',
+     'transferer': 'Charlie Miller', 'avg_rating': '4.8', 'num_reviews': '120',
+     'collection': ['GratefulDead', 'stream_only'], 'publicdate': '2020-01-10T10:00:00Z'},
+    {'identifier': 'gd1972-08-27', 'title': 'Grateful Dead Live at Old Renaissance Faire',
+     'date': '1972-08-27T00:00:00Z', 'venue': 'Old Renaissance Faire Grounds',
+     'transferer': 'Rob Eaton', 'avg_rating': ['4.9'], 'num_reviews': '80',
+     'collection': ['GratefulDead'], 'publicdate': '2020-02-01T09:00:00Z'},
+    {'identifier': 'gd1989-07-07', 'title': 'Grateful Dead Live at JFK Stadium',
+     'date': '1989-07-07T00:00:00Z', 'venue': 'JFK Stadium',
+     'avg_rating': '4.1', 'num_reviews': '15',
+     'collection': ['GratefulDead', 'stream_only'], 'publicdate': '2020-02-01T08:00:00Z'},
+]
+
+NEW_SHOWS = [
+    dict(SHOWS[2], title='Grateful Dead Live at John F. Kennedy Stadium'),
+    {'identifier': 'gd1974-06-18', 'title': 'Grateful Dead Live at Freedom Hall',
+     'date': '1974-06-18T00:00:00Z', 'venue': 'Freedom Hall',
+     'avg_rating': '4.6', 'num_reviews': '40',
+     'collection': ['GratefulDead', 'stream_only'], 'publicdate': '2020-03-05T12:00:00Z'},
+]
+
+
+def add_scrape(rsps, pages, queries):
+    pages = list(pages)
+
+    def callback(request):
+        queries.append(parse_qs(urlsplit(request.url).query)['q'][0])
+        body = {'items': pages.pop(0)}
+        if pages:
+            body['cursor'] = 'next'
+        return (200, {}, json.dumps(body))
+    rsps.add_callback(responses.POST, SCRAPE_URL, callback=callback,
+                      content_type='application/json')
+
+
+def synced_index(tmpdir, session):
+    index = ShowIndex(str(tmpdir.join('shows.sqlite')))
+    queries = []
+    with IaRequestsMock() as rsps:
+        add_scrape(rsps, [SHOWS[:2], SHOWS[2:]], queries)
+        assert index.sync(session, 'collection:GratefulDead') == 3
+    assert queries == ['collection:GratefulDead'] * 2
+    return index
+
+
+def identifiers(shows):
+    return [show['identifier'] for show in shows]
+
+
+def test_show_index_incremental_sync(tmpdir, session):
+    index = synced_index(tmpdir, session)
+    queries = []
+    with IaRequestsMock() as rsps:
+        add_scrape(rsps, [NEW_SHOWS], queries)
+        assert index.sync(session, 'collection:GratefulDead') == 2
+    assert queries == ['(collection:GratefulDead) AND publicdate:[2020-02-01 TO *]']
+
+    shows = index.search(SearchTermsModel(collection='GratefulDead'))
+    assert identifiers(shows) == ['gd1972-08-27', 'gd1974-06-18', 'gd1977-05-08',
+                                  'gd1989-07-07']
+    assert shows[3]['title'] == 'Grateful Dead Live at John F. Kennedy Stadium'
+    # The full-text index follows the update.
+    assert identifiers(index.search(SearchTermsModel(
+        search_term='Kennedy', collection='GratefulDead'))) == ['gd1989-07-07']
+    assert index.search(SearchTermsModel(search_term='Live at JFK',
+                                         collection='GratefulDead')) == []
+
+    queries = []
+    with IaRequestsMock() as rsps:
+        add_scrape(rsps, [[]], queries)
+        assert index.sync(session, 'collection:GratefulDead') == 0
+    assert queries == ['(collection:GratefulDead) AND publicdate:[2020-03-05 TO *]']
+    index.close()
+
+
+def test_show_index_search(tmpdir, session):
+    index = synced_index(tmpdir, session)
+
+    shows = index.search(SearchTermsModel())
+    assert identifiers(shows) == ['gd1977-05-08', 'gd1989-07-07']
+    assert shows[0] == {
+        'identifier': 'gd1977-05-08', 'title': 'Grateful Dead Live at Barton Hall',
+        'date': '1977-05-08T00:00:00Z', 'venue': 'Barton Hall, Cornell University',
+        'transferer': 'Charlie Miller', 'avg_rating': 4.8, 'num_reviews': 120,
+    }
+
+    def search(**kwargs):
+        return identifiers(index.search(SearchTermsModel(collection='GratefulDead',
+                                                         **kwargs)))
+    assert search(venue='Barton Hall') == ['gd1977-05-08']
+    assert search(search_term='Renaissance Faire') == ['gd1972-08-27']
+    assert search(search_term='Faire Renaissance') == []
+    assert search(transferer='Rob Eaton') == ['gd1972-08-27']
+    assert search(start_year='1977', end_year='1989') == ['gd1977-05-08', 'gd1989-07-07']
+    assert search(start_year='1972', end_year='1972') == ['gd1972-08-27']
+    assert search(min_rating='4.5') == ['gd1972-08-27', 'gd1977-05-08']
+    assert search(num_reviews='100') == ['gd1977-05-08']
+    index.close()
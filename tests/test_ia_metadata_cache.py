@@ -0,0 +1,93 @@
+import json
+
+from tests.conftest import IaRequestsMock, METADATA_URL, load_test_data_file
+
+import responses
+
+from ia_metadata_cache import MetadataCache
+
+
+def get_cache(tmpdir, session, **kwargs):
+    return MetadataCache(str(tmpdir.join('metadata.sqlite')), session=session,
+                         **kwargs)
+
+
+def add_nasa(rsps, status=200, etag='"v1"', body=None):
+    if body is None:
+        body = load_test_data_file('metadata/nasa.json')
+    rsps.add(responses.GET, METADATA_URL + 'nasa', body=body, status=status,
+             content_type='application/json',
+             headers={'ETag': etag, 'Last-Modified': 'Wed, 01 Jan 2020 00:00:00 GMT'})
+
+
+def test_metadata_cache_fresh_hit(tmpdir, session, nasa_metadata):
+    cache = get_cache(tmpdir, session)
+    with IaRequestsMock() as rsps:
+        add_nasa(rsps)
+        assert cache.get_metadata('nasa') == nasa_metadata
+        assert cache.get_metadata('nasa') == nasa_metadata
+        assert len(rsps.calls) == 1
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'revalidated': 0, 'refreshed': 0}
+    cache.close()
+
+
+def test_metadata_cache_revalidates_stale_entries(tmpdir, session, nasa_metadata):
+    cache = get_cache(tmpdir, session, ttl=0)
+    with IaRequestsMock() as rsps:
+        add_nasa(rsps)
+        add_nasa(rsps, status=304, body='')
+        assert cache.get_metadata('nasa') == nasa_metadata
+        assert cache.get_metadata('nasa') == nasa_metadata
+
+        headers = rsps.calls[1].request.headers
+        assert headers['If-None-Match'] == '"v1"'
+        assert headers['If-Modified-Since'] == 'Wed, 01 Jan 2020 00:00:00 GMT'
+        # Sent with the session's S3 keys, so dark items revalidate too.
+        assert all(call.request.headers['Authorization'] == 'LOW access:secret'
+                   for call in rsps.calls)
+    assert cache.revalidated == 1
+    cache.close()
+
+
+def test_metadata_cache_refreshes_changed_entries(tmpdir, session, nasa_metadata):
+    changed = dict(nasa_metadata, reviews=[])
+    cache = get_cache(tmpdir, session, ttl=0)
+    with IaRequestsMock() as rsps:
+        add_nasa(rsps)
+        add_nasa(rsps, etag='"v2"', body=json.dumps(changed))
+        add_nasa(rsps, status=304, body='')
+        cache.get_metadata('nasa')
+        assert cache.get_metadata('nasa') == changed
+        assert cache.get_metadata('nasa') == changed
+        assert rsps.calls[2].request.headers['If-None-Match'] == '"v2"'
+    assert (cache.refreshed, cache.revalidated) == (1, 1)
+    cache.close()
+
+
+def test_metadata_cache_persists(tmpdir, session, nasa_metadata):
+    with IaRequestsMock() as rsps:
+        add_nasa(rsps)
+        get_cache(tmpdir, session).get_metadata('nasa')
+        assert get_cache(tmpdir, session).get_metadata('nasa') == nasa_metadata
+        assert len(rsps.calls) == 1
+
+
+def test_metadata_cache_does_not_store_unknown_items(tmpdir, session):
+    cache = get_cache(tmpdir, session)
+    with IaRequestsMock() as rsps:
+        rsps.add(responses.GET, METADATA_URL + 'nope', body='{}',
+                 content_type='application/json')
+        assert cache.get_metadata('nope') == {}
+        assert cache.get_metadata('nope') == {}
+        assert len(rsps.calls) == 2
+    cache.close()
+
+
+def test_metadata_cache_evicts_least_recently_used(tmpdir, session):
+    cache = get_cache(tmpdir, session, max_bytes=1)
+    with IaRequestsMock() as rsps:
+        add_nasa(rsps)
+        cache.get_metadata('nasa')
+        cache.get_metadata('nasa')
+        assert len(rsps.calls) == 2
+    cache.close()
@@ -0,0 +1,63 @@
+import json
+import re
+import time
+
+from tests.conftest import IaRequestsMock, PROTOCOL
+
+import responses
+from requests.exceptions import ConnectionError
+
+from ia_session import get_items_bulk
+
+
+IDENTIFIERS = ['item{0}'.format(i) for i in range(6)]
+
+
+def metadata_callback(request):
+    identifier = request.url.rsplit('/', 1)[-1]
+    # The first items answer last, so completion order differs from input order.
+    time.sleep(0.05 * (len(IDENTIFIERS) - int(identifier[4:])))
+    body = {'metadata': {'identifier': identifier}, 'files': []}
+    return (200, {}, json.dumps(body))
+
+
+def add_metadata_callback(rsps):
+    url = re.compile(r'{0}//archive.org/metadata/item\d+'.format(PROTOCOL))
+    rsps.add_callback(responses.GET, url, callback=metadata_callback,
+                      content_type='application/json')
+
+
+def test_get_items_bulk_ordered(session):
+    with IaRequestsMock() as rsps:
+        add_metadata_callback(rsps)
+        results = list(get_items_bulk(session, iter(IDENTIFIERS), workers=3,
+                                      ordered=True))
+
+    assert [identifier for identifier, _ in results] == IDENTIFIERS
+    for identifier, item in results:
+        assert item.identifier == identifier
+        assert item.metadata['identifier'] == identifier
+
+
+def test_get_items_bulk_unordered(session):
+    with IaRequestsMock() as rsps:
+        add_metadata_callback(rsps)
+        results = list(get_items_bulk(session, IDENTIFIERS, workers=len(IDENTIFIERS)))
+
+    assert sorted(identifier for identifier, _ in results) == IDENTIFIERS
+    assert [identifier for identifier, _ in results] != IDENTIFIERS
+    assert all(item.metadata['identifier'] == identifier
+               for identifier, item in results)
+
+
+def test_get_items_bulk_yields_errors(session, nasa_metadata):
+    with IaRequestsMock() as rsps:
+        rsps.add_metadata_mock('nasa')
+        rsps.add(responses.GET, '{0}//archive.org/metadata/broken'.format(PROTOCOL),
+                 body=ConnectionError('connection reset'))
+        results = dict(get_items_bulk(session, ['broken', 'nasa'], workers=2,
+                                      ordered=True))
+
+    assert isinstance(results['broken'], ConnectionError)
+    assert 'connection reset' in str(results['broken'])
+    assert results['nasa'].metadata == nasa_metadata['metadata']